@@ -3,21 +3,87 @@ import appdaemon.plugins.hass.hassapi as hass
 import time
 import os
 import math
+import random
+import statistics
 import shutil
-import pandas as pd
+import sys
 import zipfile
-from datetime import datetime as dt, timedelta
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
-from bs4 import BeautifulSoup
+from datetime import datetime as dt, timedelta, date
+from contextlib import contextmanager
+from collections import deque
 import platform
 import subprocess
+import select
+import json
+import sqlite3
+import fcntl
+import base64
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import traceback
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+PND_BASE_URL = "https://pnd.cezdistribuce.cz/cezpnd2"
+PND_DASHBOARD_PATH = "/external/dashboard/view"
+PND_EXPORT_PATH = "/external/data/export"
+# Backend report ids ("idAssembly") used by the portal for the export profiles
+PND_PROFILE_ASSEMBLIES = {
+    "07 Profil spotřeby za den (+A)": -1027,
+    "08 Profil výroby za den (-A)": -1028,
+    "01 Profil spotřeby (+A)": -1021,
+    "02 Profil výroby (-A)": -1022,
+}
+# Cookie fields accepted by the DevTools Network.setCookies command
+CDP_COOKIE_FIELDS = (
+    "name",
+    "value",
+    "domain",
+    "path",
+    "secure",
+    "httpOnly",
+    "sameSite",
+    "expires",
+)
+DEBUG_LEVELS = ("off", "on-failure", "always")
+PND_DAILY_PROFILES = [
+    ("consumption", "07 Profil spotřeby za den (+A)"),
+    ("production", "08 Profil výroby za den (-A)"),
+]
+PND_QUARTER_HOUR_PROFILES = [
+    ("consumption", "01 Profil spotřeby (+A)"),
+    ("production", "02 Profil výroby (-A)"),
+]
+
+
+# pandas, numpy and selenium are imported on the first run, not on app load
+_heavy_modules_lock = threading.Lock()
+_heavy_modules_loaded = False
+
+
+def load_heavy_modules():
+    global _heavy_modules_loaded
+    global pd, np, webdriver, Service, By, Options, Keys
+    global WebDriverWait, EC, TimeoutException
+    with _heavy_modules_lock:
+        if _heavy_modules_loaded:
+            return
+        started = time.perf_counter()
+        import pandas as pd
+        import numpy as np
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.common.exceptions import TimeoutException
+
+        _heavy_modules_loaded = True
+        log(f"Modules loaded in {time.perf_counter() - started:.2f} s")
 
 
 def get_timestamp():
@@ -25,11 +91,13 @@ def get_timestamp():
 
 
 def log(message):
-    print(f"{get_timestamp()}: {message}")
+    line = f"{get_timestamp()}: {message}"
+    print(line)
+    return line
 
 
 def print_system_info():
-    log(
+    return log(
         f"""System Information:
     ===================
     Platform: {platform.system()}
@@ -44,7 +112,7 @@ def print_system_info():
 
 def print_installed_modules():
     result = subprocess.run(["pip", "list"], stdout=subprocess.PIPE, text=True)
-    log(
+    return log(
         f"""Installed Python Modules:
     {result.stdout}
     """
@@ -61,30 +129,137 @@ def get_chromedriver_version():
         )
         if result.returncode == 0:
             version_info = result.stdout.strip()
-            log(f"ChromeDriver Version: {version_info}")
+            return log(f"ChromeDriver Version: {version_info}")
         else:
-            log(f"Error: {result.stderr.strip()}")
+            return log(f"Error: {result.stderr.strip()}")
     except FileNotFoundError:
-        log("ChromeDriver is not installed or not found in the system PATH.")
-
-
-def wait_for_download(directory, timeout=30):
-    seconds = 0
-    dl_wait = True
-    while dl_wait and seconds < timeout:
-        time.sleep(1)
-        files = sorted(
-            [os.path.join(directory, f) for f in os.listdir(directory)],
-            key=os.path.getmtime,
-        )
-        # Filter out incomplete downloads
-        files = [f for f in files if not f.endswith(".crdownload")]
-        if files:
-            dl_wait = False
-        seconds += 1
-    if files:
-        return files[-1]
-    return None
+        return log("ChromeDriver is not installed or not found in the system PATH.")
+
+
+def environment_fingerprint():
+    # Changes whenever Python, an installed package or chromedriver changes,
+    # without running pip
+    parts = [sys.version]
+    for path in sys.path:
+        if os.path.isdir(path):
+            parts.append(f"{path}:{os.stat(path).st_mtime_ns}")
+    chromedriver = shutil.which("chromedriver")
+    if chromedriver:
+        stat = os.stat(chromedriver)
+        parts.append(f"{chromedriver}:{stat.st_mtime_ns}:{stat.st_size}")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+# Kept across AppDaemon module reloads, importlib.reload reuses the module namespace
+_environment_probe = globals().get("_environment_probe")
+
+
+def probe_environment(cache_path):
+    # Logs the system, module and chromedriver report, the pip and chromedriver
+    # subprocesses run only when the environment fingerprint changes
+    global _environment_probe
+    fingerprint = environment_fingerprint()
+    if _environment_probe is None and os.path.exists(cache_path):
+        try:
+            with open(cache_path, encoding="utf-8") as file:
+                _environment_probe = json.load(file)
+        except (OSError, ValueError):
+            _environment_probe = None
+    if _environment_probe and _environment_probe.get("fingerprint") == fingerprint:
+        print(_environment_probe["report"])
+        log("Environment unchanged, using the cached report")
+        return
+    report = "\n".join(
+        [print_system_info(), print_installed_modules(), get_chromedriver_version()]
+    )
+    _environment_probe = {"fingerprint": fingerprint, "report": report}
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as file:
+            json.dump(_environment_probe, file)
+    except OSError as e:
+        log(f"Failed to cache the environment report. Reason: {e}")
+
+
+def inotify_watch(folder):
+    # Returns a non-blocking inotify descriptor for finished files, None when unsupported
+    try:
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x00000008, 0x00000080, 0x00000100
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(fd, folder.encode(), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except Exception:
+        return None
+
+
+class DownloadWatcher:
+    # Chrome writes "<name>.crdownload" and renames it once all bytes have landed
+    def __init__(self, folder, extension=".csv"):
+        self.folder = folder
+        self.extension = extension
+        self.known = set(os.listdir(folder))
+        self.fd = inotify_watch(folder)
+
+    def finished_files(self):
+        return sorted(
+            name
+            for name in os.listdir(self.folder)
+            if name not in self.known
+            and not name.startswith(".")
+            and name.endswith(self.extension)
+        )
+
+    def started(self):
+        # Any new entry, including the partial .crdownload file
+        return [name for name in os.listdir(self.folder) if name not in self.known]
+
+    def wait(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while True:
+            finished = self.finished_files()
+            if finished:
+                self.known.update(finished)
+                return os.path.join(self.folder, finished[0])
+            if not self.sleep(deadline):
+                return None
+
+    def wait_started(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while not self.started():
+            if not self.sleep(deadline):
+                return False
+        return True
+
+    def sleep(self, deadline):
+        # Blocks until the folder changes or the deadline passes
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if self.fd is None:
+            time.sleep(min(remaining, 0.2))
+            return True
+        ready, _, _ = select.select([self.fd], [], [], min(remaining, 1.0))
+        if ready:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
 
 
 def delete_folder_contents(folder_path):
@@ -111,23 +286,131 @@ class Colors:
     RESET = "\033[0m"  # Reset to default color
 
 
-def zip_folder(folder_path, output_path):
-    # Create a ZIP file at the specified output path
-    with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-        # Walk through the directory
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                # Create the full path to the file
-                file_path = os.path.join(root, file)
-                # Write the file to the zip file
-                # arcname handles the path inside the zip
-                zipf.write(
-                    file_path, arcname=os.path.relpath(file_path, start=folder_path)
+# Already compressed formats are stored as they are
+STORED_EXTENSIONS = (".png", ".jpg", ".zip", ".gz")
+
+
+class DebugArchive:
+    # Rolling debug-<timestamp>.zip archives, the oldest are deleted once there
+    # are more than `keep` of them or they take more than `max_mb`
+    def __init__(self, folder, keep=5, max_mb=50):
+        self.folder = folder
+        self.keep = keep
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def write(self, source_folder):
+        os.makedirs(self.folder, exist_ok=True)
+        name = f"debug-{dt.now().strftime('%Y%m%d-%H%M%S')}.zip"
+        path = os.path.join(self.folder, name)
+        partial_path = path + ".part"
+        with zipfile.ZipFile(partial_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            for root, dirs, files in os.walk(source_folder):
+                for file in sorted(files):
+                    file_path = os.path.join(root, file)
+                    compression = (
+                        zipfile.ZIP_STORED
+                        if file.lower().endswith(STORED_EXTENSIONS)
+                        else zipfile.ZIP_DEFLATED
+                    )
+                    zipf.write(
+                        file_path,
+                        arcname=os.path.relpath(file_path, start=source_folder),
+                        compress_type=compression,
+                    )
+        os.replace(partial_path, path)
+        self.rotate()
+        return path
+
+    def archives(self):
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(
+            os.path.join(self.folder, f)
+            for f in os.listdir(self.folder)
+            if f.startswith("debug-") and f.endswith(".zip")
+        )
+
+    def rotate(self):
+        archives = self.archives()
+        total = sum(os.path.getsize(a) for a in archives)
+        # The newest archive is kept even if it alone is over the limit
+        while len(archives) > 1 and (
+            len(archives) > self.keep or total > self.max_bytes
+        ):
+            oldest = archives.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+            log(f"Removed old debug archive {os.path.basename(oldest)}")
+
+
+class DebugRecorder:
+    # "always" writes every screenshot as the run goes, "on-failure" keeps the
+    # DOM of the last steps in memory and writes it out only when a step fails
+    def __init__(self, folder, level="on-failure", capacity=20):
+        if level not in DEBUG_LEVELS:
+            log(
+                f"{Colors.YELLOW}Unknown DebugLevel '{level}', using 'on-failure'{Colors.RESET}"
+            )
+            level = "on-failure"
+        self.folder = folder
+        self.level = level
+        self.steps = deque(maxlen=capacity)
+        self.notes = {}
+        self.failed = False
+
+    @property
+    def enabled(self):
+        return self.level != "off"
+
+    def reset(self):
+        self.steps.clear()
+        self.notes = {}
+        self.failed = False
+
+    def capture(self, body, name):
+        if self.level == "always":
+            body.screenshot(os.path.join(self.folder, f"{name}.png"))
+        elif self.level == "on-failure":
+            try:
+                html = body.get_attribute("outerHTML")
+            except Exception as e:
+                html = f"<!-- snapshot failed: {e} -->"
+            self.steps.append((name, html))
+
+    def note(self, filename, text):
+        if self.enabled:
+            self.notes.setdefault(filename, []).append(text)
+
+    def write_notes(self):
+        for filename, lines in self.notes.items():
+            with open(os.path.join(self.folder, filename), "w") as file:
+                file.write("\n".join(lines) + "\n")
+
+    def fail(self, driver=None):
+        if not self.enabled or self.failed:
+            return
+        self.failed = True
+        log(f"{Colors.YELLOW}Writing debug files for the failed run{Colors.RESET}")
+        for index, (name, html) in enumerate(self.steps):
+            path = os.path.join(self.folder, f"step-{index:02d}-{name}.html")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(html)
+        self.write_notes()
+        if driver is not None:
+            try:
+                driver.find_element(By.TAG_NAME, "body").screenshot(
+                    os.path.join(self.folder, "failure.png")
                 )
+            except Exception as e:
+                log(f"Failed to take the failure screenshot. Reason: {e}")
 
 
 def quit_driver(driver):
     driver.quit()
+    # Closing the lock file releases the persistent profile
+    profile_lock = getattr(driver, "pnd_profile_lock", None)
+    if profile_lock is not None:
+        profile_lock.close()
     try:
         pid = True
         while pid:
@@ -141,9 +424,1195 @@ def quit_driver(driver):
         pass
 
 
-def conv_date(s):
-    s = s.replace("24:00:00", "23:59:00")
-    return dt.strptime(s, "%d.%m.%Y %H:%M:%S")
+# "lite" browser profile: what the portal does not need is not loaded at all
+LITE_BLOCKED_URLS = [
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.webp",
+    "*.ico",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.otf",
+    "*.mp4",
+    "*.webm",
+    "*cookiebot.com*",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*facebook.net*",
+    "*hotjar.com*",
+    "*clarity.ms*",
+]
+LITE_WINDOW_SIZE = (1280, 800)
+LITE_CHROME_ARGUMENTS = [
+    "--blink-settings=imagesEnabled=false",
+    "--renderer-process-limit=1",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-features=Translate,MediaRouter,OptimizationHints",
+    "--no-first-run",
+    "--mute-audio",
+    "--js-flags=--max-old-space-size=256",
+]
+
+
+def process_tree_rss(pid):
+    # Resident memory in bytes of the process and all its descendants, from /proc
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", encoding="utf-8") as file:
+                stat = file.read()
+        except OSError:
+            continue
+        # The command name may contain spaces, the fields after it do not
+        ppid = int(stat.rsplit(")", 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry))
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm", encoding="utf-8") as file:
+                total += int(file.read().split()[1]) * page_size
+        except (OSError, ValueError, IndexError):
+            continue
+        pending.extend(children.get(current, []))
+    return total
+
+
+class RssMonitor:
+    # Samples the RSS of a process tree on a background thread, keeps the peak
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.loop, name="pnd-rss-monitor", daemon=True
+        )
+        self.thread.start()
+
+    def sample(self):
+        self.peak = max(self.peak, process_tree_rss(self.pid))
+
+    def loop(self):
+        while not self.stopped.is_set():
+            self.sample()
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.sample()
+        return self.peak
+
+
+# Left behind by a Chrome that did not exit cleanly, they would block the profile
+CHROME_SINGLETON_FILES = ("SingletonLock", "SingletonSocket", "SingletonCookie")
+
+
+def lock_profile_folder(folder):
+    # Exclusive lock so two app instances never run Chrome on the same profile,
+    # returns the open lock file or None when the profile is in use
+    os.makedirs(folder, exist_ok=True)
+    lock_file = open(folder.rstrip("/") + ".lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    for name in CHROME_SINGLETON_FILES:
+        path = os.path.join(folder, name)
+        if os.path.lexists(path):
+            os.remove(path)
+    return lock_file
+
+
+def is_driver_alive(driver):
+    try:
+        driver.current_url
+        return len(driver.window_handles) > 0
+    except Exception:
+        return False
+
+
+def read_pnd_csv(path, engine="c"):
+    # Vectorized parse of a PND export: "dd.mm.yyyy HH:MM:SS";value
+    with open(path, encoding="latin1") as file:
+        header = file.readline().rstrip("\r\n").split(";")
+    columns = [c.strip().strip('"') for c in header[:2]]
+    if engine == "pyarrow":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            engine = "c"
+    data_pd = pd.read_csv(
+        path,
+        delimiter=";",
+        encoding="latin1",
+        usecols=columns,
+        dtype={columns[0]: str, columns[1]: "float64"},
+        engine=engine,
+    )[columns]
+    data_pd.columns = ["timestamp", "value"]
+    data_pd["timestamp"] = parse_pnd_timestamps(data_pd["timestamp"].str.strip())
+    return data_pd
+
+
+def parse_pnd_timestamps(raw):
+    # Fixed-width "dd.mm.yyyy HH:MM:SS" is decoded with integer arithmetic on the
+    # characters; 24:00:00 then naturally rolls over to 00:00:00 of the next day
+    text = raw.to_numpy(dtype="U19")
+    if len(text) and raw.str.len().eq(19).all():
+        digits = text.view(np.uint32).reshape(-1, 19).astype(np.int64) - ord("0")
+        numeric = digits[:, [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]]
+        if ((numeric >= 0) & (numeric <= 9)).all():
+            day = digits[:, 0] * 10 + digits[:, 1]
+            month = digits[:, 3] * 10 + digits[:, 4]
+            year = (
+                digits[:, 6] * 1000
+                + digits[:, 7] * 100
+                + digits[:, 8] * 10
+                + digits[:, 9]
+            )
+            seconds = (
+                (digits[:, 11] * 10 + digits[:, 12]) * 3600
+                + (digits[:, 14] * 10 + digits[:, 15]) * 60
+                + digits[:, 17] * 10
+                + digits[:, 18]
+            )
+            days = ((year - 1970) * 12 + month - 1).astype("datetime64[M]").astype(
+                "datetime64[D]"
+            ) + (day - 1).astype("timedelta64[D]")
+            return pd.Series(
+                days.astype("datetime64[ns]") + seconds.astype("timedelta64[s]"),
+                index=raw.index,
+            )
+    end_of_day = raw.str.endswith("24:00:00")
+    timestamps = pd.to_datetime(
+        raw.str.replace("24:00:00", "00:00:00", regex=False),
+        format="%d.%m.%Y %H:%M:%S",
+    )
+    return timestamps + pd.to_timedelta(end_of_day.astype("int64"), unit="D")
+
+
+def period_days(timestamps):
+    # Rows are stamped with the end of their period, so 24:00 belongs to the day before
+    return (timestamps - pd.Timedelta(minutes=1)).dt.normalize()
+
+
+def range_filename(index, data_name):
+    return f"range-{data_name}.csv" if index == 0 else f"range{index}-{data_name}.csv"
+
+
+def quarter_hour_filename(month, data_name):
+    return f"qh-{month:%Y-%m}-{data_name}.csv"
+
+
+def month_ranges(first_day, last_day):
+    # [(month start, next month start)] covering first_day..last_day
+    month = dt(first_day.year, first_day.month, 1)
+    ranges = []
+    while month.date() <= last_day:
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        ranges.append((month, next_month))
+        month = next_month
+    return ranges
+
+
+class QuarterHourStore:
+    # One compressed .npz per ELM and month: "ts" int64 seconds of the interval
+    # end (portal wall time), one float32 kWh array per direction
+    COLUMNS = ("consumption", "production")
+
+    def __init__(self, folder, settle_days=3):
+        self.folder = folder
+        self.settle_days = settle_days
+
+    def path(self, elm, month):
+        return os.path.join(self.folder, f"qh-{elm}-{month:%Y-%m}.npz")
+
+    def missing_months(self, elm, first_day, last_day):
+        # Months that are not stored yet or were still open when downloaded
+        missing = []
+        for month, next_month in month_ranges(first_day, last_day):
+            path = self.path(elm, month)
+            if os.path.exists(path):
+                stored = date.fromtimestamp(os.path.getmtime(path))
+                if stored > next_month.date() + timedelta(days=self.settle_days):
+                    continue
+            if month.date() >= date.today():
+                # The first day of the month is published the next day
+                continue
+            missing.append((month, next_month))
+        return missing
+
+    def save(self, elm, month, frames):
+        # frames: {column: DataFrame(timestamp, value)} from read_pnd_csv
+        stamps = {
+            column: frame["timestamp"].to_numpy("datetime64[s]").astype(np.int64)
+            for column, frame in frames.items()
+        }
+        ts = np.unique(np.concatenate(list(stamps.values())))
+        arrays = {"ts": ts}
+        for column in self.COLUMNS:
+            values = np.full(len(ts), np.nan, dtype=np.float32)
+            if column in frames:
+                values[np.searchsorted(ts, stamps[column])] = frames[column][
+                    "value"
+                ].to_numpy(np.float32)
+            arrays[column] = values
+        os.makedirs(self.folder, exist_ok=True)
+        partial_path = self.path(elm, month) + ".part.npz"
+        np.savez_compressed(partial_path, **arrays)
+        os.replace(partial_path, self.path(elm, month))
+        return len(ts)
+
+    def load(self, elm, first_day, last_day):
+        parts = []
+        for month, _ in month_ranges(first_day, last_day):
+            path = self.path(elm, month)
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    parts.append({key: data[key] for key in ("ts",) + self.COLUMNS})
+        if not parts:
+            empty = np.empty(0, dtype=np.float32)
+            return np.empty(0, dtype=np.int64), {c: empty for c in self.COLUMNS}
+        ts = np.concatenate([part["ts"] for part in parts])
+        start = np.datetime64(first_day, "s").astype(np.int64)
+        end = np.datetime64(last_day + timedelta(days=1), "s").astype(np.int64)
+        # Interval ends, so the first quarter of a day is stamped 00:15
+        keep = (ts > start) & (ts <= end)
+        return ts[keep], {
+            column: np.concatenate([part[column] for part in parts])[keep]
+            for column in self.COLUMNS
+        }
+
+
+def is_sub_daily(timestamps):
+    # A daily profile saved under a quarter-hour name has a day between rows
+    if len(timestamps) < 2:
+        return True
+    return timestamps.diff().dropna().median() < pd.Timedelta(days=1)
+
+
+def epoch_to_iso(seconds):
+    return str(np.datetime64(int(seconds), "s"))
+
+
+def quarter_hour_summary(ts, columns):
+    # Aggregates small enough for state attributes, the raw profile never is
+    summary = {"intervals": int(len(ts))}
+    if not len(ts):
+        return summary
+    summary["first"] = epoch_to_iso(ts[0] - 900)
+    summary["last"] = epoch_to_iso(ts[-1])
+    hours = ((ts - 900) // 3600) % 24
+    for column, values in columns.items():
+        valid = ~np.isnan(values)
+        if not valid.any():
+            continue
+        peak = int(np.nanargmax(values))
+        summary[f"{column}_kwh"] = round(float(np.nansum(values)), 3)
+        summary[f"{column}_peak_kw"] = round(float(values[peak]) * 4, 3)
+        summary[f"{column}_peak_at"] = epoch_to_iso(ts[peak] - 900)
+        totals = np.bincount(hours[valid], weights=values[valid], minlength=24)
+        days = max(len(np.unique((ts[valid] - 900) // 86400)), 1)
+        summary[f"{column}_by_hour"] = [round(float(v), 3) for v in totals / days]
+    return summary
+
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+MINUTES_PER_WEEK = 7 * 24 * 60
+
+
+def parse_low_tariff(schedule):
+    # {"mon": ["00:00-06:00", ...], ..., "default": [...]} -> [(first, last)]
+    # minutes of the week (Monday 00:00 = 0), days without an entry use "default".
+    # A window over midnight ("22:00-06:00") continues on the next day
+    if not isinstance(schedule, dict):
+        raise ValueError(
+            "expected the keys mon to sun or default with lists of windows"
+        )
+    windows = []
+    for index, weekday in enumerate(WEEKDAYS):
+        key = weekday if weekday in schedule else "default"
+        day_windows = schedule.get(key, [])
+        if not isinstance(day_windows, list):
+            raise ValueError(f"the windows of '{key}' are not a list")
+        for window in day_windows:
+            try:
+                start, end = [part.strip() for part in str(window).split("-", 1)]
+                start_hour, start_minute = map(int, start.split(":"))
+                end_hour, end_minute = map(int, end.split(":"))
+            except ValueError:
+                raise ValueError(f"Invalid low tariff window '{window}'")
+            first = start_hour * 60 + start_minute
+            last = end_hour * 60 + end_minute
+            if not (0 <= first < 24 * 60 and 0 <= last <= 24 * 60) or first == last:
+                raise ValueError(f"Invalid low tariff window '{window}'")
+            day = index * 1440
+            if first < last:
+                windows.append((day + first, day + last))
+            else:
+                next_day = (index + 1) % 7 * 1440
+                windows.append((day + first, day + 1440))
+                windows.append((next_day, next_day + last))
+    return windows
+
+
+def parse_tariff_prices(prices):
+    # {"high": 4.85, "low": 2.95, "currency": "CZK"} -> the same with floats
+    if not isinstance(prices, dict):
+        raise ValueError("expected the keys high, low and optionally currency")
+    parsed = {"currency": str(prices.get("currency", "CZK"))}
+    for tariff in ("high", "low"):
+        if tariff not in prices:
+            raise ValueError(f"the price '{tariff}' is missing")
+        try:
+            parsed[tariff] = float(prices[tariff])
+        except (TypeError, ValueError):
+            raise ValueError(f"the price '{tariff}' is not a number")
+    return parsed
+
+
+def low_tariff_minutes(windows):
+    # 0/1 per minute of the week
+    minutes = np.zeros(MINUTES_PER_WEEK, dtype=np.float64)
+    for first, last in windows:
+        minutes[first:last] = 1
+    return minutes
+
+
+def tariff_split(ts, values, low_minutes, step=900):
+    # Interval ends -> per-day high and low tariff kWh. The share of every
+    # interval that falls into the low tariff is looked up in the cumulative
+    # minute mask, so windows need not align with the intervals
+    valid = ~np.isnan(values)
+    starts = ts[valid] - step
+    values = values[valid].astype(np.float64)
+    if not len(starts):
+        return [], [], []
+    length = step // 60
+    cumulative = np.concatenate(([0.0], np.cumsum(np.tile(low_minutes, 2))))
+    # 1.1.1970 was a Thursday, minute 0 of the mask is Monday 00:00
+    minute_of_week = (starts // 60 + 3 * 1440) % MINUTES_PER_WEEK
+    low_share = (
+        cumulative[minute_of_week + length] - cumulative[minute_of_week]
+    ) / length
+    day_numbers = starts // 86400
+    days, index = np.unique(day_numbers, return_inverse=True)
+    low = np.bincount(index, weights=values * low_share)
+    high = np.bincount(index, weights=values) - low
+    return (
+        [
+            str(day)
+            for day in (days * 86400).astype("datetime64[s]").astype("datetime64[D]")
+        ],
+        [round(float(v), 3) for v in high],
+        [round(float(v), 3) for v in low],
+    )
+
+
+def hourly_sums(ts, columns):
+    # Quarter-hour kWh summed per hour -> ["YYYY-MM-DDTHH:00"], {name: [kWh]}.
+    # All columns share one hour axis, an hour without any value of a column is NaN
+    unique_hours, index = np.unique((ts - 900) // 3600, return_inverse=True)
+    keys = (unique_hours * 3600).astype("datetime64[s]").astype("datetime64[m]")
+    sums = {}
+    for name, values in columns.items():
+        valid = ~np.isnan(values)
+        totals = np.bincount(
+            index[valid],
+            weights=values[valid].astype(np.float64),
+            minlength=len(unique_hours),
+        ).astype(np.float64)
+        totals[np.bincount(index[valid], minlength=len(unique_hours)) == 0] = np.nan
+        sums[name] = [round(float(v), 3) for v in totals]
+    return [str(key) for key in keys], sums
+
+
+def week_starts(days):
+    return days - pd.to_timedelta(days.dt.dayofweek, unit="D")
+
+
+def month_starts(days):
+    return days.dt.to_period("M").dt.start_time
+
+
+def year_starts(days):
+    return days.dt.to_period("Y").dt.start_time
+
+
+def billing_period_starts(days, start_day, start_month):
+    # First day of the yearly billing period that contains each day
+    before = (days.dt.month < start_month) | (
+        (days.dt.month == start_month) & (days.dt.day < start_day)
+    )
+    return pd.to_datetime(
+        pd.DataFrame(
+            {
+                "year": days.dt.year - before.astype(int),
+                "month": start_month,
+                "day": start_day,
+            }
+        )
+    )
+
+
+def parse_billing_start(value):
+    # "27.10" -> (27, 10). A YAML value without quotes arrives as the float
+    # 27.1, which would silently mean 27 January, so only strings are accepted
+    if not isinstance(value, str):
+        raise ValueError(f"'{value}' must be a quoted string such as \"27.10\"")
+    parts = value.strip().rstrip(".").split(".")
+    if len(parts) != 2 or not all(part.isdigit() for part in parts):
+        raise ValueError(f"'{value}' is not a day and month such as \"27.10\"")
+    day, month = int(parts[0]), int(parts[1])
+    try:
+        # The period must start on the same day every year, 29.02 does not exist
+        # in most of them
+        date(2001, month, day)
+    except ValueError:
+        raise ValueError(f"'{value}' is not a date that exists every year")
+    return day, month
+
+
+# Aggregate sensors: name -> first day of the bucket of each day
+AGGREGATE_BUCKETS = {
+    "weekly": week_starts,
+    "monthly": month_starts,
+    "yearly": year_starts,
+}
+
+
+def aggregate_daily(days, consumption, production, bucket_starts):
+    # Per-day kWh -> {"period": [first day], "consumption": [kWh], "production":
+    # [kWh], "production2consumption": [%]}, one entry per bucket
+    days = pd.to_datetime(pd.Series(days, dtype="object"))
+    frame = pd.DataFrame(
+        {"consumption": consumption, "production": production}, dtype="float64"
+    )
+    sums = frame.groupby(bucket_starts(days).values).sum(min_count=1)
+    ratio = (sums["production"] / sums["consumption"] * 100).replace(
+        [np.inf, -np.inf], np.nan
+    )
+
+    def values(series, digits):
+        return [None if pd.isna(v) else round(float(v), digits) for v in series]
+
+    return {
+        "period": [f"{day:%Y-%m-%d}" for day in sums.index],
+        "consumption": values(sums["consumption"], 3),
+        "production": values(sums["production"], 3),
+        "production2consumption": values(ratio, 2),
+    }
+
+
+def to_midnight(day):
+    return dt(day.year, day.month, day.day)
+
+
+def sum_kwh(values):
+    return sum(v for v in values if v is not None and not math.isnan(v))
+
+
+def parse_data_interval(value):
+    # "27.10.2023 00:00 - 27.10.2024 00:00" -> (datetime, datetime)
+    start, end = [part.strip() for part in value.split(" - ", 1)]
+    return dt.strptime(start, "%d.%m.%Y %H:%M"), dt.strptime(end, "%d.%m.%Y %H:%M")
+
+
+class LoginFormParser(HTMLParser):
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self._form = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form":
+            self._form = {
+                "action": attrs.get("action") or "",
+                "method": (attrs.get("method") or "post").lower(),
+                "inputs": [],
+            }
+            self.forms.append(self._form)
+        elif tag == "input" and self._form is not None:
+            self._form["inputs"].append(attrs)
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+
+
+def find_login_form(html):
+    parser = LoginFormParser()
+    parser.feed(html or "")
+    for form in parser.forms:
+        if any(i.get("type") == "password" for i in form["inputs"]):
+            return form
+    return None
+
+
+class PndHttpClient:
+    # Talks to the portal backend directly, without a browser
+    def __init__(self, base_url, username, password, timeout=60, pool_size=4):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=None,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(
+            {
+                "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) HomeAssistant-PND",
+                "Accept-Language": "cs-CZ,cs;q=0.9",
+            }
+        )
+
+    @property
+    def dashboard_url(self):
+        return self.base_url + PND_DASHBOARD_PATH
+
+    def login(self):
+        response = self.session.get(self.dashboard_url, timeout=self.timeout)
+        response.raise_for_status()
+        form = find_login_form(response.text)
+        if form is None:
+            log("HTTP session already authenticated")
+            return False
+        payload = {}
+        username_set = False
+        for field in form["inputs"]:
+            name = field.get("name")
+            if not name:
+                continue
+            field_type = (field.get("type") or "text").lower()
+            if field_type == "password":
+                payload[name] = self.password
+            elif field_type in ("email", "text") and not username_set:
+                payload[name] = self.username
+                username_set = True
+            elif field_type not in ("checkbox", "submit", "button"):
+                payload[name] = field.get("value") or ""
+        action = urljoin(response.url, form["action"] or response.url)
+        response = self.session.post(action, data=payload, timeout=self.timeout)
+        response.raise_for_status()
+        if find_login_form(response.text) is not None:
+            raise Exception("Unable to login to the app over HTTP")
+        log(f"HTTP login finished at {response.url}")
+        return True
+
+    def export_csv(self, link_text, interval_from, interval_to, elm, target_path):
+        payload = {
+            "format": "csv",
+            "idAssembly": PND_PROFILE_ASSEMBLIES[link_text],
+            "idDeviceSet": None,
+            "intervalFrom": interval_from.strftime("%d.%m.%Y %H:%M"),
+            "intervalTo": interval_to.strftime("%d.%m.%Y %H:%M"),
+            "compareFrom": None,
+            "opmId": None,
+            "electrometerId": elm,
+        }
+        with self.session.post(
+            self.base_url + PND_EXPORT_PATH,
+            json=payload,
+            timeout=self.timeout,
+            stream=True,
+        ) as response:
+            response.raise_for_status()
+            if "html" in response.headers.get("Content-Type", ""):
+                # The portal answers with the login page once the session is gone
+                raise Exception(f"Export of {link_text} returned HTML instead of CSV")
+            partial_path = target_path + ".part"
+            with open(partial_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=65536):
+                    file.write(chunk)
+        os.replace(partial_path, target_path)
+        log(f"{Colors.GREEN}File downloaded and saved as: {target_path}{Colors.RESET}")
+
+    def close(self):
+        self.session.close()
+
+    def export_cookies(self):
+        return [
+            {
+                "name": c.name,
+                "value": c.value,
+                "domain": c.domain,
+                "path": c.path,
+                "secure": bool(c.secure),
+                "httpOnly": c.has_nonstandard_attr("HttpOnly"),
+                "expires": c.expires or -1,
+            }
+            for c in self.session.cookies
+        ]
+
+    def import_cookies(self, cookies):
+        for c in cookies:
+            self.session.cookies.set(
+                c["name"],
+                c["value"],
+                domain=c.get("domain", ""),
+                path=c.get("path", "/"),
+                secure=c.get("secure", False),
+                expires=c["expires"] if c.get("expires", -1) > 0 else None,
+            )
+
+
+class HistoryStore:
+    # Per-day values keyed by ELM, kept between runs so only new days are downloaded
+    COLUMNS = ("consumption", "production")
+
+    def __init__(self, path, settle_days=3, merge_gap_days=7):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.settle_days = settle_days
+        self.merge_gap_days = merge_gap_days
+        with self.connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS daily ("
+                " elm TEXT NOT NULL, day TEXT NOT NULL,"
+                " consumption REAL, production REAL, fetched_at TEXT,"
+                " PRIMARY KEY (elm, day))"
+            )
+
+    @contextmanager
+    def connect(self):
+        db = sqlite3.connect(self.path)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def missing_ranges(self, elm, first_day, last_day):
+        # Gap index: days that are not complete yet, grouped into inclusive date ranges
+        with self.connect() as db:
+            rows = db.execute(
+                "SELECT day, consumption IS NOT NULL AND production IS NOT NULL, fetched_at"
+                " FROM daily WHERE elm = ? AND day BETWEEN ? AND ?",
+                (elm, first_day.isoformat(), last_day.isoformat()),
+            ).fetchall()
+        status = {day: (complete, fetched_at) for day, complete, fetched_at in rows}
+        ranges = []
+        day = first_day
+        while day <= last_day:
+            complete, fetched_at = status.get(day.isoformat(), (False, None))
+            # A day still empty long after it ended has no data on the portal at all
+            settled = fetched_at is not None and date.fromisoformat(
+                fetched_at[:10]
+            ) > day + timedelta(days=self.settle_days)
+            if not complete and not settled:
+                if ranges and (day - ranges[-1][1]).days <= self.merge_gap_days:
+                    ranges[-1][1] = day
+                else:
+                    ranges.append([day, day])
+            day += timedelta(days=1)
+        return [tuple(r) for r in ranges]
+
+    def mark_fetched(self, elm, first_day, last_day):
+        fetched_at = dt.now().isoformat(timespec="seconds")
+        days = []
+        day = first_day
+        while day <= last_day:
+            days.append((elm, day.isoformat(), fetched_at))
+            day += timedelta(days=1)
+        with self.connect() as db:
+            db.executemany(
+                "INSERT INTO daily (elm, day, fetched_at) VALUES (?, ?, ?)"
+                " ON CONFLICT (elm, day) DO UPDATE SET fetched_at = excluded.fetched_at",
+                days,
+            )
+
+    def upsert_daily(self, elm, column, rows):
+        if column not in self.COLUMNS:
+            raise ValueError(f"Unknown history column {column}")
+        with self.connect() as db:
+            db.executemany(
+                f"INSERT INTO daily (elm, day, {column}) VALUES (?, ?, ?)"
+                f" ON CONFLICT (elm, day) DO UPDATE SET {column} = excluded.{column}",
+                [(elm, day, value) for day, value in rows],
+            )
+
+    def daily_series(self, elm, first_day, last_day):
+        with self.connect() as db:
+            return db.execute(
+                "SELECT day, consumption, production FROM daily"
+                " WHERE elm = ? AND day BETWEEN ? AND ?"
+                " AND (consumption IS NOT NULL OR production IS NOT NULL)"
+                " ORDER BY day",
+                (elm, first_day.isoformat(), last_day.isoformat()),
+            ).fetchall()
+
+
+class HomeAssistantWebSocket:
+    # Minimal client for the Home Assistant websocket API
+    def __init__(self, ha_url, token, timeout=30):
+        import websocket
+
+        url = ha_url.rstrip("/") + "/api/websocket"
+        url = url.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+        self.ws = websocket.create_connection(url, timeout=timeout)
+        self.message_id = 0
+        self.receive()  # auth_required
+        self.ws.send(json.dumps({"type": "auth", "access_token": token}))
+        message = self.receive()
+        if message.get("type") != "auth_ok":
+            self.close()
+            raise Exception(
+                f"Home Assistant websocket authentication failed: {message}"
+            )
+
+    def receive(self):
+        return json.loads(self.ws.recv())
+
+    def call(self, message_type, **payload):
+        self.message_id += 1
+        self.ws.send(
+            json.dumps({"id": self.message_id, "type": message_type, **payload})
+        )
+        while True:
+            message = self.receive()
+            if message.get("id") == self.message_id and message.get("type") == "result":
+                if not message.get("success"):
+                    raise Exception(f"{message_type} failed: {message.get('error')}")
+                return message.get("result")
+
+    def close(self):
+        self.ws.close()
+
+
+def plan_statistics_import(imported, series):
+    # imported: {day: [value, sum]} already sent to HA; series: sorted [(day, value)]
+    changed = [day for day, value in series if imported.get(day, [None])[0] != value]
+    if not changed:
+        return []
+    first_changed = min(changed)
+    previous = [day for day in imported if day < first_changed]
+    running_sum = imported[max(previous)][1] if previous else 0.0
+    rows = []
+    for day, value in series:
+        if day < first_changed:
+            continue
+        running_sum = round(running_sum + value, 3)
+        rows.append((day, value, running_sum))
+    return rows
+
+
+class PndMeter:
+    def __init__(self, elm, suffix, prefix=""):
+        self.elm = str(elm)
+        self.suffix = suffix
+        self.prefix = prefix
+        self.ranges = []
+        self.quarter_hour_ranges = []
+        self.daily_export = True
+
+    def filename(self, name):
+        return self.prefix + name
+
+
+class PndAccount:
+    def __init__(self, username, password, meters):
+        self.username = username
+        self.password = password
+        self.meters = meters
+        self.session_cache = None
+        self.elm_cache = None
+
+
+def as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+class SessionCache:
+    # Authenticated cookies and localStorage, encrypted with a key derived from the password
+    def __init__(self, folder, username, password, app_id, ttl):
+        key = hashlib.sha256(f"{username}|{app_id}".encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(folder, f"session-{key}.bin")
+        self.username = username
+        self.password = password
+        self.app_id = app_id
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._fernet = None
+        self._available = None
+
+    @property
+    def enabled(self):
+        if self._available is None:
+            try:
+                from cryptography.fernet import Fernet
+            except ImportError:
+                log(
+                    f"{Colors.YELLOW}Python module cryptography is not installed, session cache disabled{Colors.RESET}"
+                )
+                self._available = False
+                return False
+            salt = f"pnd-session|{self.username}|{self.app_id}".encode("utf-8")
+            derived = hashlib.pbkdf2_hmac(
+                "sha256", self.password.encode("utf-8"), salt, 100000
+            )
+            self._fernet = Fernet(base64.urlsafe_b64encode(derived))
+            self._available = True
+        return self._available
+
+    def load(self):
+        if not self.enabled or not os.path.exists(self.path):
+            self.record(False, "no cached session")
+            return None
+        try:
+            with open(self.path, "rb") as file:
+                entry = json.loads(self._fernet.decrypt(file.read()))
+        except Exception as e:
+            self.record(False, f"unreadable cache ({e.__class__.__name__})")
+            self.invalidate()
+            return None
+        if entry.get("expires", 0) <= time.time():
+            self.record(False, "cached session expired")
+            self.invalidate()
+            return None
+        return entry
+
+    def save(self, cookies, local_storage=None):
+        if not self.enabled:
+            return
+        now = time.time()
+        expires = now + self.ttl
+        for cookie in cookies:
+            # Persistent cookies shorten the entry, session cookies (-1) do not
+            if now < cookie.get("expires", -1) < expires:
+                expires = cookie["expires"]
+        entry = {
+            "account": self.username,
+            "id": self.app_id,
+            "created": now,
+            "expires": expires,
+            "cookies": cookies,
+            "local_storage": local_storage or {},
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        partial_path = self.path + ".part"
+        with open(partial_path, "wb") as file:
+            file.write(self._fernet.encrypt(json.dumps(entry).encode("utf-8")))
+        os.chmod(partial_path, 0o600)
+        os.replace(partial_path, self.path)
+        log(
+            f"Session cached until {dt.fromtimestamp(expires).isoformat(timespec='seconds')}"
+        )
+
+    def invalidate(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def record(self, hit, reason=""):
+        if hit:
+            self.hits += 1
+            log(f"{Colors.GREEN}Session cache hit{Colors.RESET}")
+        else:
+            self.misses += 1
+            log(f"{Colors.YELLOW}Session cache miss: {reason}{Colors.RESET}")
+
+
+class ScrapeCancelled(Exception):
+    pass
+
+
+class StepTimeout(Exception):
+    # The running step used up its time, the attempt fails and may be retried
+    pass
+
+
+class ScrapeWorker:
+    # Runs queued jobs one at a time on a dedicated thread, a job that is
+    # already waiting in the queue is not queued twice
+    def __init__(self, handler, on_change=None):
+        self.handler = handler
+        self.on_change = on_change
+        self.pending = []
+        self.running = None
+        self.cancel_requested = threading.Event()
+        # Deadline (time.monotonic) of the running step, see StepEngine
+        self.deadline = None
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.thread = threading.Thread(target=self.loop, name="pnd-worker", daemon=True)
+        self.thread.start()
+
+    @property
+    def depth(self):
+        return len(self.pending) + (1 if self.running is not None else 0)
+
+    def submit(self, job):
+        with self.condition:
+            if job in self.pending:
+                return False
+            self.pending.append(job)
+            self.condition.notify()
+        self.changed()
+        return True
+
+    def cancel(self):
+        # Drops the queue and asks the running job to stop at its next checkpoint
+        with self.condition:
+            dropped = len(self.pending)
+            self.pending.clear()
+            if self.running is not None:
+                self.cancel_requested.set()
+        self.changed()
+        return dropped
+
+    def check_cancelled(self):
+        if self.cancel_requested.is_set():
+            raise ScrapeCancelled()
+
+    def remaining(self, seconds):
+        # `seconds` capped by the deadline of the running step
+        if self.deadline is None:
+            return seconds
+        return max(0, min(seconds, self.deadline - time.monotonic()))
+
+    def check_deadline(self):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise StepTimeout("Step timed out")
+
+    def sleep(self, seconds):
+        # time.sleep that returns early on cancellation, the run stops at the
+        # next check_cancelled() so half-done page steps are not interrupted.
+        # Past the step deadline it raises StepTimeout
+        self.cancel_requested.wait(self.remaining(seconds))
+        self.check_deadline()
+
+    def stop(self, timeout=30):
+        with self.condition:
+            self.stopped = True
+            self.pending.clear()
+            self.cancel_requested.set()
+            self.condition.notify()
+        self.thread.join(timeout)
+
+    def changed(self):
+        if self.on_change is not None:
+            try:
+                self.on_change()
+            except Exception as e:
+                log(f"Failed to publish worker state. Reason: {e}")
+
+    def loop(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                self.running = self.pending.pop(0)
+                self.cancel_requested.clear()
+            self.changed()
+            try:
+                self.handler(self.running)
+            except ScrapeCancelled:
+                log(f"{Colors.YELLOW}Job '{self.running}' cancelled{Colors.RESET}")
+            except Exception as e:
+                log(
+                    f"{Colors.RED}ERROR: Job '{self.running}' failed: {e}{Colors.RESET}"
+                )
+                log(traceback.format_exc())
+            finally:
+                with self.condition:
+                    self.running = None
+                self.changed()
+
+
+class PublishCache:
+    # Hash of the last published state and attributes per entity, kept between
+    # restarts so identical data is not written to Home Assistant again
+    def __init__(self, path):
+        self.path = path
+        self.hashes = {}
+        self.changed = False
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as file:
+                    self.hashes = json.load(file)
+            except (OSError, ValueError) as e:
+                log(f"Failed to read the publish cache. Reason: {e}")
+
+    @staticmethod
+    def digest(state, attributes):
+        payload = json.dumps(
+            [state, attributes or {}], sort_keys=True, default=str, ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def unchanged(self, entity_id, digest):
+        return self.hashes.get(entity_id) == digest
+
+    def remember(self, entity_id, digest):
+        if self.hashes.get(entity_id) != digest:
+            self.hashes[entity_id] = digest
+            self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        partial_path = self.path + ".part"
+        with open(partial_path, "w", encoding="utf-8") as file:
+            json.dump(self.hashes, file)
+        os.replace(partial_path, self.path)
+        self.changed = False
+
+
+class ElmCache:
+    # ELM options offered to the account by the portal, kept for `ttl` seconds
+    def __init__(self, folder, username, ttl):
+        key = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(folder, f"elms-{key}.json")
+        self.ttl = ttl
+        self.elms = None
+
+    def load(self):
+        if self.elms is None and os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as file:
+                    entry = json.load(file)
+            except (OSError, ValueError):
+                return None
+            if entry.get("fetched", 0) + self.ttl > time.time():
+                self.elms = entry.get("elms", [])
+        return self.elms
+
+    def save(self, elms):
+        self.elms = elms
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump({"fetched": time.time(), "elms": elms}, file)
+
+    def invalidate(self):
+        self.elms = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def contains(self, elm):
+        return any(elm in option for option in self.load() or [])
+
+
+class PublicationSchedule:
+    # Learns when the portal publishes the previous day (seconds after midnight)
+    # and plans the scheduled runs around it, kept in `path` between restarts
+    def __init__(
+        self,
+        path,
+        earliest,
+        lead=600,
+        backoff=600,
+        max_backoff=7200,
+        samples=14,
+    ):
+        self.path = path
+        self.earliest = earliest
+        self.lead = lead
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.samples = samples
+        self.state = {"published": [], "done_day": None, "unpublished": None}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as file:
+                    self.state.update(json.load(file))
+            except (OSError, ValueError) as e:
+                log(f"Failed to read the schedule state. Reason: {e}")
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as file:
+            json.dump(self.state, file)
+
+    @property
+    def publication_time(self):
+        if not self.state["published"]:
+            return None
+        return statistics.median(self.state["published"])
+
+    def start_time(self):
+        # Start a little before the usual publication, a miss then moves the
+        # estimate later again through the retries
+        if self.publication_time is None:
+            return self.earliest
+        return max(self.earliest, self.publication_time - self.lead)
+
+    def retry_delay(self, attempt):
+        # Exponential backoff with "equal jitter"
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def done(self, day):
+        return self.state["done_day"] == day.isoformat()
+
+    def mark_done(self, day):
+        self.state["done_day"] = day.isoformat()
+        self.save()
+
+    def record_unpublished(self, day, seconds):
+        self.state["unpublished"] = [day.isoformat(), seconds]
+        self.save()
+
+    def record_published(self, day, seconds):
+        # The data appeared between the last check that missed it and this one
+        unpublished = self.state["unpublished"]
+        if unpublished and unpublished[0] == day.isoformat():
+            seconds = (unpublished[1] + seconds) / 2
+        self.state["published"] = (self.state["published"] + [round(seconds)])[
+            -self.samples :
+        ]
+        self.state["unpublished"] = None
+        self.mark_done(day)
+
+
+def seconds_of_day(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
+def format_seconds_of_day(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+# Texts of the ELM options of the device set dropdown, read inside the browser
+ELM_OPTIONS_SCRIPT = """
+return Array.from(
+    arguments[0].querySelectorAll('span.multiselect__option'),
+    span => span.textContent.trim()
+).filter(text => text.startsWith('ELM'));
+"""
 
 
 def _normalize_ha_state(value):
@@ -158,41 +1627,460 @@ def _normalize_ha_state(value):
     return s[:255]  # HA hard limit
 
 
+class RunTrace:
+    # Step timings and retry counts of one run, appended as one JSON line per run.
+    # Once the file is over `max_kb` it is moved to trace.jsonl.1 (.1 to .2, ...),
+    # only `keep` old files are kept
+    def __init__(self, path, keep=3, max_kb=1024):
+        self.path = path
+        self.keep = keep
+        self.max_bytes = max_kb * 1024
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.perf_started = time.perf_counter()
+        self.spans = []
+        self.retries = {}
+        self.stack = []
+
+    @contextmanager
+    def span(self, name):
+        self.stack.append(name)
+        path = "/".join(self.stack)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.stack.pop()
+            self.spans.append(
+                {
+                    "name": path,
+                    "start": round(started - self.perf_started, 3),
+                    "duration": round(time.perf_counter() - started, 3),
+                    "status": status,
+                }
+            )
+
+    def retry(self, name):
+        self.retries[name] = self.retries.get(name, 0) + 1
+
+    def durations(self):
+        # Total seconds per step, repeated steps (e.g. every export) are summed
+        totals = {}
+        for span in self.spans:
+            totals[span["name"]] = round(
+                totals.get(span["name"], 0) + span["duration"], 3
+            )
+        return totals
+
+    def write(self, status):
+        entry = {
+            "started": dt.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "duration": round(time.time() - self.started, 3),
+            "status": status,
+            "retries": self.retries,
+            "spans": sorted(
+                self.spans, key=lambda span: (span["start"], span["name"].count("/"))
+            ),
+        }
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        if os.path.getsize(self.path) > self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        oldest = f"{self.path}.{self.keep}"
+        if os.path.exists(oldest):
+            os.remove(oldest)
+        for index in range(self.keep - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.keep > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        log(f"Rotated {os.path.basename(self.path)}")
+
+
+def traced(name):
+    # Records the decorated pnd method as a span of the current run
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.trace.span(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class PortalError(Exception):
+    # A failure that another attempt cannot fix (unknown ELM, ...)
+    pass
+
+
+class Step:
+    # One step of the portal flow. `done` tells whether the effect of the step
+    # is still in place, so a resumed run can skip it; `failed` is called once
+    # the retries are used up. `scope` groups the steps, e.g. (account,) for
+    # the login and (account, meter) for the ELM and its exports
+    def __init__(
+        self,
+        name,
+        action,
+        done=None,
+        timeout=120,
+        retries=2,
+        failed=None,
+        scope=(),
+    ):
+        self.name = name
+        self.action = action
+        self.done = done
+        self.timeout = timeout
+        self.retries = retries
+        self.failed = failed
+        self.scope = tuple(scope)
+
+    def contains(self, other):
+        # The step is a prerequisite of `other` (same account or meter group)
+        return other.scope[: len(self.scope)] == self.scope
+
+    def is_done(self):
+        if self.done is None:
+            return False
+        try:
+            return bool(self.done())
+        except Exception:
+            return False
+
+
+class StepEngine:
+    # Runs steps in order. After a transient failure the run resumes at the
+    # failed step with the same browser: the earlier steps of its own scope
+    # (its account login, its meter's ELM) are checked and only the ones whose
+    # effect is gone (and everything after them) run again. Steps of other
+    # accounts and meters are not touched
+    def __init__(
+        self,
+        trace,
+        before_step=None,
+        on_retry=None,
+        check_cancelled=None,
+        set_deadline=None,
+    ):
+        self.trace = trace
+        self.before_step = before_step
+        self.set_deadline = set_deadline
+        self.on_retry = on_retry
+        self.check_cancelled = check_cancelled
+        self.attempt = 0
+
+    def run(self, steps):
+        attempts = [0] * len(steps)
+        failed_at = None
+        invalidated = False
+        index = 0
+        while index < len(steps):
+            step = steps[index]
+            if self.check_cancelled is not None:
+                self.check_cancelled()
+            if failed_at is not None:
+                if index < failed_at and not step.contains(steps[failed_at]):
+                    index += 1
+                    continue
+                if index < failed_at and not invalidated:
+                    if step.done is None or step.is_done():
+                        index += 1
+                        continue
+                    log(f"Step '{step.name}' has to be repeated")
+                    invalidated = True
+                elif step.is_done():
+                    log(f"Step '{step.name}' already done, skipping")
+                    index += 1
+                    continue
+                if index >= failed_at:
+                    failed_at = None
+            self.attempt = attempts[index]
+            try:
+                if self.before_step is not None:
+                    self.before_step(step)
+                if self.set_deadline is not None:
+                    # The step checks the deadline in its sleeps and waits
+                    self.set_deadline(time.monotonic() + step.timeout)
+                step.action()
+            except (ScrapeCancelled, PortalError):
+                raise
+            except Exception as e:
+                if self.check_cancelled is not None:
+                    # Steps cut short by a cancellation fail on their own
+                    self.check_cancelled()
+                attempts[index] += 1
+                if attempts[index] > step.retries:
+                    if step.failed is not None:
+                        step.failed(e)
+                    raise
+                self.trace.retry(step.name)
+                log(
+                    f"{Colors.YELLOW}Step '{step.name}' failed ({e}), "
+                    f"attempt {attempts[index] + 1}/{step.retries + 1}{Colors.RESET}"
+                )
+                if self.on_retry is not None:
+                    self.on_retry(step, e)
+                failed_at = index
+                invalidated = False
+                index = next(i for i, s in enumerate(steps) if s.contains(step))
+                continue
+            finally:
+                if self.set_deadline is not None:
+                    self.set_deadline(None)
+            index += 1
+
+
 class pnd(hass.Hass):
     def initialize(self):
+        started = time.perf_counter()
         log(">>>>>>>>>>>> PND Initialize")
-        print_system_info()
-        print_installed_modules()
-        get_chromedriver_version()
-
-        self.username = self.args["PNDUserName"]
-        self.password = self.args["PNDUserPassword"]
         self.download_folder = self.args["DownloadFolder"]
-        self.datainterval = self.args["DataInterval"]
-        self.ELM = self.args["ELM"]
+        self.datainterval = self.args.get("DataInterval")
+        self.data_interval_days = self.args.get("DataIntervalDays")
         self.id = self.args.get("id", "")
         self.suffix = f"_{self.id}" if self.id else ""
+        self.engine = str(self.args.get("Engine", "selenium")).lower()
+        self.base_url = self.args.get("PNDBaseURL", PND_BASE_URL).rstrip("/")
+        self.keep_browser = bool(self.args.get("KeepBrowser", False))
+        self.browser_idle_timeout = int(self.args.get("BrowserIdleTimeout", 900))
+        self.download_timeout = int(self.args.get("DownloadTimeout", 60))
+        self.browser_profile = str(self.args.get("BrowserProfile", "full")).lower()
+        self.persistent_profile = bool(self.args.get("PersistentProfile", False))
+        self.browser_cache_mb = int(self.args.get("BrowserCacheMB", 100))
+        self.csv_engine = str(self.args.get("CsvEngine", "c")).lower()
+        self.debug = DebugRecorder(
+            self.download_folder,
+            str(self.args.get("DebugLevel", "on-failure")).lower(),
+        )
+        self.debug_archive = DebugArchive(
+            self.args.get(
+                "DebugArchiveFolder",
+                os.path.join(
+                    os.path.dirname(os.path.normpath(self.download_folder)),
+                    f"pnd{self.suffix}-debug",
+                ),
+            ),
+            int(self.args.get("DebugArchiveKeep", 5)),
+            float(self.args.get("DebugArchiveMaxMB", 50)),
+        )
+        self.driver = None
+        self.driver_idle_timer = None
+        # Guards self.driver between the worker thread and the idle timer
+        self.driver_lock = threading.Lock()
+        self.driver_account = None
+        self.storage_script_id = None
+        self.state_folder = self.args.get(
+            "StateFolder",
+            os.path.join(
+                os.path.dirname(os.path.normpath(self.download_folder)),
+                f".pnd{self.suffix}",
+            ),
+        )
+        probe_environment(os.path.join(self.state_folder, "environment.json"))
+        self.status_attributes = {}
+        self.trace = RunTrace(
+            os.path.join(self.state_folder, "trace.jsonl"),
+            int(self.args.get("TraceKeep", 3)),
+            int(self.args.get("TraceMaxKB", 1024)),
+        )
+        self.publish_cache = PublishCache(
+            os.path.join(self.state_folder, "published.json")
+        )
+        self.skipped_writes = 0
+        self.accounts = self.load_accounts()
+        self.meters = [meter for account in self.accounts for meter in account.meters]
+        self.output_mode = str(self.args.get("OutputMode", "attributes")).lower()
+        self.ha_url = self.args.get("HAURL")
+        self.ha_token = self.args.get("HAToken")
+        self.quarter_hour = None
+        if self.args.get("QuarterHour", False):
+            self.quarter_hour = QuarterHourStore(
+                os.path.join(self.state_folder, "quarter-hour")
+            )
+        self.aggregates = bool(self.args.get("Aggregates", False))
+        self.billing_start = None
+        if self.args.get("BillingPeriodStart"):
+            try:
+                self.billing_start = parse_billing_start(
+                    self.args["BillingPeriodStart"]
+                )
+            except ValueError as e:
+                log(f"{Colors.RED}ERROR: BillingPeriodStart ignored, {e}{Colors.RESET}")
+        self.low_tariff = None
+        if self.args.get("LowTariff"):
+            try:
+                self.low_tariff = parse_low_tariff(self.args["LowTariff"])
+            except ValueError as e:
+                log(f"{Colors.RED}ERROR: LowTariff ignored, {e}{Colors.RESET}")
+            if self.quarter_hour is None:
+                log(
+                    f"{Colors.YELLOW}LowTariff needs the quarter-hour profiles, set QuarterHour: true{Colors.RESET}"
+                )
+        self.tariff_prices = None
+        if self.args.get("TariffPrices"):
+            try:
+                self.tariff_prices = parse_tariff_prices(self.args["TariffPrices"])
+            except ValueError as e:
+                log(f"{Colors.RED}ERROR: TariffPrices ignored, {e}{Colors.RESET}")
+        self.history = None
+        if self.args.get("HistoryStore", False):
+            self.history = HistoryStore(
+                os.path.join(self.state_folder, "history.sqlite3")
+            )
+        self.phase = "idle"
+        self.script_status = ("Stopped", "Idle")
+        self.yesterday_complete = False
+        self.worker = ScrapeWorker(self.run_job, self.publish_worker_state)
         self.listen_event(self.run_pnd, "run_pnd")
+        self.listen_event(self.cancel_pnd, "cancel_pnd")
+        self.schedule = None
+        self.schedule_timer = None
+        self.schedule_attempt = 0
+        if self.args.get("Schedule", False):
+            earliest = dt.strptime(str(self.args.get("ScheduleTime", "00:30")), "%H:%M")
+            self.schedule = PublicationSchedule(
+                os.path.join(self.state_folder, "schedule.json"),
+                seconds_of_day(earliest),
+                backoff=int(self.args.get("ScheduleBackoff", 600)),
+            )
+            self.schedule_retries = int(self.args.get("ScheduleRetries", 8))
+            self.run_daily(self.plan_scheduled_run, earliest.time())
+            # Catch up when AppDaemon starts after the daily planning time
+            self.plan_scheduled_run({})
+        self.publish_startup_time(time.perf_counter() - started)
+
+    def load_accounts(self):
+        # One account with one ELM keeps the original entity names, more meters
+        # get the ELM number appended to the suffix
+        accounts_config = self.args.get("Accounts") or [
+            {
+                "PNDUserName": self.args["PNDUserName"],
+                "PNDUserPassword": self.args["PNDUserPassword"],
+                "ELM": self.args["ELM"],
+            }
+        ]
+        meter_count = sum(len(as_list(a["ELM"])) for a in accounts_config)
+        accounts = []
+        for account_config in accounts_config:
+            meters = [
+                (
+                    PndMeter(elm, self.suffix)
+                    if meter_count == 1
+                    else PndMeter(elm, f"{self.suffix}_{elm}", f"{elm}-")
+                )
+                for elm in as_list(account_config["ELM"])
+            ]
+            account = PndAccount(
+                account_config["PNDUserName"], account_config["PNDUserPassword"], meters
+            )
+            account.elm_cache = ElmCache(
+                self.state_folder,
+                account.username,
+                int(self.args.get("ElmCacheTTL", 604800)),
+            )
+            if self.args.get("SessionCache", False):
+                account.session_cache = SessionCache(
+                    self.state_folder,
+                    account.username,
+                    account.password,
+                    self.id,
+                    int(self.args.get("SessionCacheTTL", 43200)),
+                )
+            accounts.append(account)
+        log(
+            f"Configured {len(accounts)} account(s) with ELM "
+            + ", ".join(m.elm for a in accounts for m in a.meters)
+        )
+        return accounts
 
     def terminate(self):
         log(">>>>>>>>>>>> PND Terminate")
+        self.worker.stop()
+        self.close_driver()
 
     def set_state_safe(self, entity_id, state, attributes=None):
-        return self.set_state(
+        return self.publish_state(
             entity_id, state=_normalize_ha_state(state), attributes=attributes or {}
         )
 
+    def publish_state(self, entity_id, state=None, attributes=None, ignore_state=False):
+        # Skips writes that would not change the entity; `ignore_state` leaves
+        # the state (e.g. a run timestamp) out of the comparison
+        digest = PublishCache.digest(None if ignore_state else state, attributes)
+        if self.publish_cache.unchanged(entity_id, digest) and (
+            self.get_state(entity_id) is not None
+        ):
+            self.skipped_writes += 1
+            return None
+        result = self.set_state(entity_id, state=state, attributes=attributes or {})
+        self.publish_cache.remember(entity_id, digest)
+        return result
+
     def set_state_pnd_running(self, state):
         state_str = "on" if state else "off"
         self.set_state(f"binary_sensor.pnd_running{self.suffix}", state=state_str)
 
     def set_state_pnd_script_status(self, state, status_message):
+        self.script_status = (state, status_message)
         self.set_state(
             f"sensor.pnd_script_status{self.suffix}",
             state=state,
-            attributes={"status": status_message, "friendly_name": "PND Script Status"},
+            attributes={
+                "status": status_message,
+                "friendly_name": "PND Script Status",
+                **self.status_attributes,
+            },
+        )
+
+    def publish_worker_state(self):
+        self.status_attributes["queue_depth"] = self.worker.depth
+        self.status_attributes["phase"] = self.phase
+        self.set_state_pnd_script_status(*self.script_status)
+
+    def set_phase(self, phase):
+        # Phase boundaries are also the points where a cancelled run stops
+        self.worker.check_cancelled()
+        log(f"Phase: {phase}")
+        self.phase = phase
+        self.publish_worker_state()
+
+    def publish_startup_time(self, seconds):
+        log(f"Initialized in {seconds:.3f} s")
+        self.status_attributes["startup_time"] = round(seconds, 3)
+        # Keep the state of the last run, only the attributes are refreshed
+        current = self.get_state(
+            f"sensor.pnd_script_status{self.suffix}", attribute="all"
         )
+        if current:
+            self.script_status = (
+                current.get("state", "Stopped"),
+                current.get("attributes", {}).get("status", "Idle"),
+            )
+        self.set_state_pnd_script_status(*self.script_status)
+
+    def update_session_cache_metrics(self):
+        caches = [a.session_cache for a in self.accounts if a.session_cache]
+        if caches:
+            self.status_attributes["session_cache_hits"] = sum(c.hits for c in caches)
+            self.status_attributes["session_cache_misses"] = sum(
+                c.misses for c in caches
+            )
 
+    @traced("chrome_start")
     def load_chrome_driver(self):
         chrome_options = Options()
         chrome_options.add_experimental_option(
@@ -209,6 +2097,27 @@ class pnd(hass.Hass):
         chrome_options.add_argument("--disable-gpu")
         chrome_options.add_argument("--disable-dev-shm-usage")
         chrome_options.add_argument("--log-level=3")  # Disable logging
+        window_size = (1920, 1080)
+        if self.browser_profile == "lite":
+            window_size = LITE_WINDOW_SIZE
+            chrome_options.add_argument(
+                f"--window-size={window_size[0]},{window_size[1]}"
+            )
+            for argument in LITE_CHROME_ARGUMENTS:
+                chrome_options.add_argument(argument)
+        profile_lock = None
+        if self.persistent_profile:
+            profile_folder = os.path.join(self.state_folder, "chrome-profile")
+            profile_lock = lock_profile_folder(profile_folder)
+            if profile_lock is None:
+                log(
+                    f"{Colors.YELLOW}Chrome profile {profile_folder} is used by another instance, starting with a temporary profile{Colors.RESET}"
+                )
+            else:
+                chrome_options.add_argument(f"--user-data-dir={profile_folder}")
+                chrome_options.add_argument(
+                    f"--disk-cache-size={self.browser_cache_mb * 2**20}"
+                )
         # load service
         service = Service("/usr/bin/chromedriver")
         # load driver
@@ -216,6 +2125,8 @@ class pnd(hass.Hass):
             driver = webdriver.Chrome(service=service, options=chrome_options)
             log("Driver Loaded")
         except:
+            if profile_lock is not None:
+                profile_lock.close()
             log(
                 f"{Colors.RED}ERROR: Unable to initialize Chrome Driver - exitting{Colors.RESET}"
             )
@@ -225,13 +2136,145 @@ class pnd(hass.Hass):
                 "ERROR: Nepodařilo se inicializovat Chrome Driver, zkontroluj nastavení AppDaemon",
             )
             raise Exception("Unable to initialize Chrome Driver - exitting")
-        driver.set_window_size(1920, 1080)
+        driver.set_window_size(*window_size)
+        if profile_lock is not None:
+            driver.pnd_profile_lock = profile_lock
+            # Only the HTTP cache is kept, the login stays with SessionCache
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.execute_cdp_cmd(
+                "Storage.clearDataForOrigin",
+                {
+                    "origin": "{0.scheme}://{0.netloc}".format(urlsplit(self.base_url)),
+                    "storageTypes": "local_storage,session_storage,indexeddb",
+                },
+            )
+            log("Using the persistent Chrome profile")
+        if self.browser_profile == "lite":
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd(
+                "Network.setBlockedURLs", {"urls": LITE_BLOCKED_URLS}
+            )
+            log(f"Lite browser profile, blocking {len(LITE_BLOCKED_URLS)} URL patterns")
         return driver
 
+    def get_driver(self):
+        with self.driver_lock:
+            if self.driver_idle_timer is not None:
+                self.cancel_timer(self.driver_idle_timer)
+                self.driver_idle_timer = None
+            if self.driver is not None:
+                if is_driver_alive(self.driver):
+                    log("Reusing running Chrome Driver")
+                    return self.driver, True
+                log(
+                    f"{Colors.YELLOW}Chrome Driver is not responding, starting a new one{Colors.RESET}"
+                )
+                self.close_driver()
+        driver = self.load_chrome_driver()
+        if self.keep_browser:
+            with self.driver_lock:
+                self.driver = driver
+        return driver, False
+
+    def release_driver(self, driver):
+        with self.driver_lock:
+            if driver is self.driver:
+                # Keep the logged-in browser for the next run, close it when idle
+                self.driver_idle_timer = self.run_in(
+                    self.close_idle_driver, self.browser_idle_timeout
+                )
+                log(f"Browser kept open for {self.browser_idle_timeout} s")
+                return
+        quit_driver(driver)
+        log("All Done - BROWSER CLOSED")
+
+    def close_idle_driver(self, kwargs):
+        # Under driver_lock, a run that starts now gets a new browser instead
+        # of the one being closed
+        with self.driver_lock:
+            self.driver_idle_timer = None
+            if self.worker.running is not None:
+                # The next run picked the browser up in the meantime
+                return
+            log("Browser idle timeout reached")
+            self.close_driver()
+
+    def close_driver(self):
+        if self.driver is None:
+            return
+        driver, self.driver = self.driver, None
+        try:
+            quit_driver(driver)
+            log("All Done - BROWSER CLOSED")
+        except Exception as e:
+            log(f"Failed to close Chrome Driver. Reason: {e}")
+
+    def is_logged_in(self, driver):
+        # The dashboard and the login form are mutually exclusive
+        try:
+            WebDriverWait(driver, 10).until(
+                lambda d: d.find_elements(
+                    By.XPATH, "//h1[contains(text(), 'Naměřená data')]"
+                )
+                or d.find_elements(
+                    By.XPATH, "//input[@placeholder='Zadejte své heslo']"
+                )
+            )
+        except TimeoutException:
+            return False
+        return bool(
+            driver.find_elements(By.XPATH, "//h1[contains(text(), 'Naměřená data')]")
+        )
+
+    @traced("session_restore")
+    def restore_browser_session(self, driver, account):
+        if account.session_cache is None:
+            return False
+        entry = account.session_cache.load()
+        if entry is None:
+            return False
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setCookies", {"cookies": entry["cookies"]})
+            if entry["local_storage"]:
+                parts = urlsplit(self.base_url)
+                self.storage_script_id = driver.execute_cdp_cmd(
+                    "Page.addScriptToEvaluateOnNewDocument",
+                    {
+                        "source": "(function(items, origin) {"
+                        " if (location.origin !== origin) return;"
+                        " for (var k in items) {"
+                        "  if (localStorage.getItem(k) === null) localStorage.setItem(k, items[k]);"
+                        " }"
+                        f"}})({json.dumps(entry['local_storage'])}, {json.dumps(f'{parts.scheme}://{parts.netloc}')});"
+                    },
+                )["identifier"]
+        except Exception as e:
+            account.session_cache.record(False, f"unable to restore cookies ({e})")
+            return False
+        log(f"Restored {len(entry['cookies'])} cached cookies")
+        return True
+
+    def save_browser_session(self, driver, account):
+        if account.session_cache is None:
+            return
+        try:
+            cookies = driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]
+            local_storage = driver.execute_script(
+                "return Object.assign({}, window.localStorage);"
+            )
+            account.session_cache.save(
+                [{k: c[k] for k in CDP_COOKIE_FIELDS if k in c} for c in cookies],
+                local_storage,
+            )
+        except Exception as e:
+            log(f"{Colors.YELLOW}Unable to cache browser session: {e}{Colors.RESET}")
+
+    @traced("portal_load")
     def load_pnd_portal(self, driver):
         try:
             # driver.get("https://dip.cezdistribuce.cz/irj/portal/?zpnd=")  # Change to the website's login page
-            PNDURL = "https://pnd.cezdistribuce.cz/cezpnd2/external/dashboard/view"
+            PNDURL = self.base_url + PND_DASHBOARD_PATH
             log(f"Opening Website: {PNDURL}")
             driver.get(PNDURL)  # Change to the website's login page
             log("Website Opened")
@@ -242,10 +2285,11 @@ class pnd(hass.Hass):
                 "Error", "ERROR: Nepodařilo se otevřít webovou stránku PND portálu"
             )
             raise Exception("Unable to open website - exitting")
-        time.sleep(3)  # Allow time for the page to load
+        self.worker.sleep(3)  # Allow time for the page to load
         log(f"Current URL: {driver.current_url}")
 
-    def login_to_pnd_portal(self, driver):
+    @traced("login")
+    def login_to_pnd_portal(self, driver, account):
         try:
             # Locate the element that might be blocking the login button
             cookie_banner_close_button = driver.find_element(
@@ -255,7 +2299,7 @@ class pnd(hass.Hass):
             cookie_banner_close_button.click()
         except:
             log("No cookie banner found")
-        time.sleep(1)  # Allow time for the page to load
+        self.worker.sleep(1)  # Allow time for the page to load
         # Simulate login
         try:
             # username_field = driver.find_element(By.XPATH, "//input[@placeholder='Uživatelské jméno / e-mail']")
@@ -272,8 +2316,8 @@ class pnd(hass.Hass):
                 "//button[@type='submit' and contains(@class, 'mui-btn--primary')]",
             )
             # Enter login credentials and click the button
-            username_field.send_keys(self.username)
-            password_field.send_keys(self.password)
+            username_field.send_keys(account.username)
+            password_field.send_keys(account.password)
             # Wait until the login button is clickable
             wait = WebDriverWait(driver, 10)  # 10-second timeout
             # login_button = wait.until(EC.element_to_be_clickable((By.XPATH, "//button[@type='submit' and @color='primary']")))
@@ -287,7 +2331,7 @@ class pnd(hass.Hass):
                 )
             )
             body = driver.find_element(By.TAG_NAME, "body")
-            body.screenshot(self.download_folder + "/00.png")
+            self.debug.capture(body, "00")
             login_button.click()
         except:
             log(
@@ -300,7 +2344,7 @@ class pnd(hass.Hass):
             )
             raise Exception("Failed to find or click the login button")
         # Allow time for login processing
-        time.sleep(5)  # Adjust as needed
+        self.worker.sleep(5)  # Adjust as needed
         log(f"Current URL: {driver.current_url}")
         # Verify successful login
         wait = WebDriverWait(driver, 20)  # 10-second timeout
@@ -314,6 +2358,9 @@ class pnd(hass.Hass):
                 )
             )
         except:
+            # Without the portal's alert the page is only slow, the step may
+            # be retried; with it the credentials were rejected and another
+            # attempt would only count as one more failed login
             alert_widget_content = driver.find_element(
                 By.CLASS_NAME, "alertWidget__content"
             ).text
@@ -322,8 +2369,8 @@ class pnd(hass.Hass):
             self.set_state_pnd_script_status(
                 "Error", "ERROR: Není možné se přihlásit do aplikace"
             )
-            raise Exception(f"Unable to login to the app")
-        body.screenshot(self.download_folder + "/01.png")
+            raise PortalError(f"Unable to login to the app: {alert_widget_content}")
+        self.debug.capture(body, "01")
         # Print whether the H1 tag with the specified text is found
         if h1_element:
             log(f"H1 tag with text '{h1_text}' is present.")
@@ -338,13 +2385,18 @@ class pnd(hass.Hass):
             )
             raise Exception(f"Failed to find H1 tag with text '{h1_text}'")
 
+        self.close_modal_dialog(driver)
+
+    @traced("modal_dialog")
+    def close_modal_dialog(self, driver):
+        body = driver.find_element(By.TAG_NAME, "body")
         # Check for Modal Dialog
         try:
             modal_dialog = driver.find_element(By.CLASS_NAME, "modal-dialog")
             log(f"{Colors.YELLOW}Modal Dialog found{Colors.RESET}")
             # Close the modal dialog
             try:
-                body.screenshot(self.download_folder + "/01-modal.png")
+                self.debug.capture(body, "01-modal")
                 log(f"{Colors.YELLOW}Closing Modal Dialog{Colors.RESET}")
                 close_button = modal_dialog.find_element(
                     By.XPATH,
@@ -354,7 +2406,7 @@ class pnd(hass.Hass):
                 log(
                     f"{Colors.GREEN}Modal Dialog closed successfully, reloading page{Colors.RESET}"
                 )
-                time.sleep(2)  # Allow time for the modal to close
+                self.worker.sleep(2)  # Allow time for the modal to close
                 # Reload the page after clicking the button
                 driver.refresh()
                 log(f"{Colors.GREEN}Page reloaded successfully{Colors.RESET}")
@@ -367,8 +2419,9 @@ class pnd(hass.Hass):
             log(
                 f"{Colors.GREEN}Modal dialog not found. Continuing without closing modal.{Colors.RESET}"
             )
-        time.sleep(2)  # Allow time for the page to load
+        self.worker.sleep(2)  # Allow time for the page to load
 
+    @traced("portal_version")
     def get_pnd_portal_version(self, driver):
         # Get the app version
         version_element = driver.find_element(
@@ -389,10 +2442,11 @@ class pnd(hass.Hass):
         )
         log(f"App Version: {version_number}")
 
+    @traced("select_profile")
     def select_export_profile(self, driver, profile_type, link_text, image_id):
         wait = WebDriverWait(driver, 10)  # Adjust timeout as necessary
         body = driver.find_element(By.TAG_NAME, "body")
-        body.screenshot(f"{self.download_folder}/{profile_type}-body-{image_id}.png")
+        self.debug.capture(body, f"{profile_type}-body-{image_id}")
         # Find and click the link by its exact text
         try:
             link = WebDriverWait(
@@ -406,18 +2460,14 @@ class pnd(hass.Hass):
                 )
             )
             log(f"Selecting profile: {link.text}")
-            time.sleep(2)
-            body.screenshot(
-                f"{self.download_folder}/{profile_type}-body-{image_id}a.png"
-            )
+            self.worker.sleep(2)
+            self.debug.capture(body, f"{profile_type}-body-{image_id}a")
             link.click()
-            body.screenshot(
-                f"{self.download_folder}/{profile_type}-body-{image_id}b.png"
-            )
+            self.debug.capture(body, f"{profile_type}-body-{image_id}b")
             body.click()
-            body.screenshot(
-                f"{self.download_folder}/{profile_type}-body-{image_id}c.png"
-            )
+            self.debug.capture(body, f"{profile_type}-body-{image_id}c")
+        except StepTimeout:
+            raise
         except:
             log(f"{Colors.RED}ERROR: Failed to find link {link_text}{Colors.RESET}")
             self.set_state_pnd_running(False)
@@ -425,10 +2475,44 @@ class pnd(hass.Hass):
                 "Error",
                 f"ERROR: Nepodařilo se najít odkaz pro {profile_type} profil {link_text}",
             )
-
-    def download_export_file(self, driver, profile_type, link_text):
+            # Exporting anyway would save the previously selected profile
+            # under this profile's name
+            raise PortalError(f"Failed to find link {link_text}")
+
+    def download_exports(self, driver, profile_type, exports):
+        # Each export downloads into its own folder, so the next one can be
+        # started while the previous file is still being transferred
+        started = []
+        try:
+            for index, (link_text, filename) in enumerate(exports):
+                folder = os.path.join(self.download_folder, f".export-{index}")
+                self.select_export_profile(
+                    driver, profile_type, link_text, link_text[:2]
+                )
+                watcher = self.start_export_download(
+                    driver, profile_type, link_text, folder
+                )
+                started.append((link_text, filename, watcher))
+            for link_text, filename, watcher in started:
+                downloaded_file = self.finish_export_download(
+                    watcher, profile_type, link_text
+                )
+                self.rename_downloaded_file(downloaded_file, filename)
+        finally:
+            for _, _, watcher in started:
+                watcher.close()
+                shutil.rmtree(watcher.folder, ignore_errors=True)
+
+    @traced("export_download")
+    def start_export_download(self, driver, profile_type, link_text, folder):
+        os.makedirs(folder, exist_ok=True)
+        watcher = DownloadWatcher(folder)
         # Wait for the dropdown toggle and click it using the button text
         try:
+            driver.execute_cdp_cmd(
+                "Page.setDownloadBehavior",
+                {"behavior": "allow", "downloadPath": folder},
+            )
             wait = WebDriverWait(driver, 10)  # 10-second timeout
             # Wait for the dropdown toggle and click it
             toggle_button = wait.until(
@@ -436,7 +2520,7 @@ class pnd(hass.Hass):
                     (By.XPATH, "//button[contains(text(), 'Exportovat data')]")
                 )
             )
-            time.sleep(2)
+            self.worker.sleep(2)
             toggle_button.click()
             # Wait for the CSV link and click it
             csv_link = wait.until(
@@ -444,7 +2528,14 @@ class pnd(hass.Hass):
             )
             log(f"Downloading CSV file for {link_text}")
             csv_link.click()
+            # The download path is fixed once the file is created, only then
+            # the next export may switch it
+            started = watcher.wait_started(self.worker.remaining(self.download_timeout))
+        except StepTimeout:
+            watcher.close()
+            raise
         except:
+            watcher.close()
             log(
                 f"{Colors.RED}ERROR: Failed to download CSV file for {link_text}{Colors.RESET}"
             )
@@ -453,49 +2544,340 @@ class pnd(hass.Hass):
                 "Error",
                 f"ERROR: Nepodařilo se stáhnout CSV soubor pro {profile_type} profil {link_text}",
             )
-        # Wait for the download to complete
-        time.sleep(5)
-
-    def rename_downloaded_file(self, new_filename, link_text):
-        # downloaded_file = wait_for_download(self.download_folder)
-        downloaded_file = os.path.join(self.download_folder, "pnd_export.csv")
-        # Rename the file if it was downloaded
-        if downloaded_file:
-            new_filename = os.path.join(self.download_folder, new_filename)
-            os.remove(new_filename) if os.path.exists(new_filename) else None
-            os.rename(downloaded_file, new_filename)
+            raise Exception(f"Failed to download CSV file for {link_text}")
+        if not started:
+            watcher.close()
+            self.worker.check_deadline()
             log(
-                f"{Colors.GREEN}File downloaded and saved as: {new_filename}{Colors.RESET}"
+                f"{Colors.RED}ERROR: Download of {link_text} did not start within {self.download_timeout} s{Colors.RESET}"
             )
-        else:
+            self.set_state_pnd_running(False)
+            self.set_state_pnd_script_status(
+                "Error",
+                f"ERROR: CSV soubor pro {profile_type} profil {link_text} se nestáhl včas",
+            )
+            raise Exception(f"No file was downloaded for {link_text}")
+        return watcher
+
+    @traced("export_wait")
+    def finish_export_download(self, watcher, profile_type, link_text):
+        downloaded_file = watcher.wait(self.worker.remaining(self.download_timeout))
+        if downloaded_file is None:
+            self.worker.check_deadline()
             log(
-                f"{Colors.RED}ERROR: No file was downloaded for {link_text}{Colors.RESET}"
+                f"{Colors.RED}ERROR: No file was downloaded for {link_text} within {self.download_timeout} s{Colors.RESET}"
+            )
+            self.set_state_pnd_running(False)
+            self.set_state_pnd_script_status(
+                "Error",
+                f"ERROR: CSV soubor pro {profile_type} profil {link_text} se nestáhl včas",
+            )
+            raise Exception(f"No file was downloaded for {link_text}")
+        log(f"Download finished: {downloaded_file}")
+        return downloaded_file
+
+    def rename_downloaded_file(self, downloaded_file, new_filename):
+        new_filename = os.path.join(self.download_folder, new_filename)
+        os.replace(downloaded_file, new_filename)
+        log(f"{Colors.GREEN}File downloaded and saved as: {new_filename}{Colors.RESET}")
+
+    @traced("http_login")
+    def open_http_session(self, client, account):
+        cache = account.session_cache
+        entry = cache.load() if cache else None
+        if entry is not None:
+            client.import_cookies(entry["cookies"])
+        log(f"Logging in to PND portal over HTTP as {account.username}")
+        fresh_login = client.login()
+        if cache is not None:
+            if entry is not None:
+                if fresh_login:
+                    cache.record(False, "cached session rejected by the portal")
+                else:
+                    cache.record(True)
+            if fresh_login or entry is None:
+                cache.save(client.export_cookies())
+            self.update_session_cache_metrics()
+
+    @traced("download_http")
+    def download_with_http(self):
+        today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        for account in self.accounts:
+            client = PndHttpClient(self.base_url, account.username, account.password)
+            try:
+                self.open_http_session(client, account)
+                for meter in account.meters:
+                    self.worker.check_cancelled()
+                    exports = [
+                        (
+                            meter.filename(f"daily-{data_name}.csv"),
+                            link_text,
+                            today - timedelta(days=1),
+                            today,
+                        )
+                        for data_name, link_text in PND_DAILY_PROFILES
+                        if meter.daily_export
+                    ]
+                    for index, (range_from, range_to) in enumerate(meter.ranges):
+                        exports += [
+                            (
+                                meter.filename(range_filename(index, data_name)),
+                                link_text,
+                                range_from,
+                                range_to,
+                            )
+                            for data_name, link_text in PND_DAILY_PROFILES
+                        ]
+                    for range_from, range_to in meter.quarter_hour_ranges:
+                        month = range_from.replace(day=1)
+                        exports += [
+                            (
+                                meter.filename(quarter_hour_filename(month, data_name)),
+                                link_text,
+                                range_from,
+                                range_to,
+                            )
+                            for data_name, link_text in PND_QUARTER_HOUR_PROFILES
+                        ]
+                    self.export_csv_files(client, meter, exports)
+            finally:
+                client.close()
+        log("All Done - DATA DOWNLOADED OVER HTTP")
+
+    def export_csv_files(self, client, meter, exports):
+        # Every export goes to its own target file, so they can run side by side
+        def export(filename, link_text, period_from, period_to):
+            self.worker.check_cancelled()
+            log(f"Downloading CSV file for {link_text} ({filename})")
+            client.export_csv(
+                link_text,
+                period_from,
+                period_to,
+                meter.elm,
+                os.path.join(self.download_folder, filename),
             )
 
-    def run_pnd(self, event_name, data, kwargs):
-        script_start_time = dt.now()
-        log(
-            f"{Colors.CYAN}********************* Starting {VERSION} *********************{Colors.RESET}"
-        )
-        self.set_state_pnd_running(True)
-        self.set_state_pnd_script_status("Running", "OK")
-        log("----------------------------------------------")
-        log("Hello from AppDaemon for Portal Namerenych Dat")
-        # Cleanup
-        delete_folder_contents(self.download_folder + "/")
-        os.makedirs(self.download_folder, exist_ok=True)
-        
+        with ThreadPoolExecutor(
+            max_workers=client.pool_size, thread_name_prefix="pnd-export"
+        ) as executor:
+            futures = [executor.submit(export, *entry) for entry in exports]
+            for future in futures:
+                future.result()
+
+    @traced("download_selenium")
+    def download_with_selenium(self):
         # Load Chrome Driver
-        driver = self.load_chrome_driver()
-        # Load PND Portal
-        self.load_pnd_portal(driver)
-        # Login to PND Portal
-        self.login_to_pnd_portal(driver)
-        # Get PND Portal version
-        self.get_pnd_portal_version(driver)
+        driver, reused = self.get_driver()
+        if not reused:
+            self.driver_account = None
+        monitor = RssMonitor(driver.service.process.pid)
+        try:
+            self.scrape_with_selenium(driver)
+        except Exception:
+            if not self.worker.cancel_requested.is_set():
+                self.debug.fail(driver)
+            raise
+        finally:
+            peak = monitor.stop()
+            self.status_attributes["browser_peak_rss_mb"] = round(peak / 2**20, 1)
+            log(f"Browser peak memory {peak / 2**20:.1f} MB")
+            # Close the browser
+            self.release_driver(driver)
+
+    def scrape_with_selenium(self, driver):
+        engine = StepEngine(
+            self.trace,
+            before_step=lambda step: self.apply_step_timeout(driver, step),
+            on_retry=self.resume_after_failure,
+            check_cancelled=self.worker.check_cancelled,
+            set_deadline=lambda deadline: setattr(self.worker, "deadline", deadline),
+        )
+        engine.run(self.portal_steps(driver, engine))
+        log("All Done - INTERVAL DATA DOWNLOADED")
 
-        wait = WebDriverWait(driver, 20)  # 10-second timeout
-        body = driver.find_element(By.TAG_NAME, "body")
+    def portal_steps(self, driver, engine):
+        # login -> export form -> quick report -> per meter: ELM -> period -> exports
+        steps = []
+        for index, account in enumerate(self.accounts):
+            steps += [
+                Step(
+                    "login",
+                    functools.partial(self.open_account, driver, index, account),
+                    done=lambda account=account: self.driver_account == account.username
+                    and self.is_logged_in(driver),
+                    scope=(index,),
+                ),
+                Step(
+                    "export_form",
+                    functools.partial(self.open_export_form, driver),
+                    done=lambda: driver.find_elements(
+                        By.XPATH, "//label[contains(text(), 'Sestava')]"
+                    ),
+                    timeout=60,
+                    scope=(index,),
+                ),
+                Step(
+                    "quick_report",
+                    lambda: self.select_quick_report(driver, engine.attempt),
+                    done=lambda: driver.find_elements(
+                        By.XPATH,
+                        "//span[@class='multiselect__single' and contains(text(), 'Rychlá sestava')]",
+                    ),
+                    timeout=30,
+                    retries=9,
+                    failed=self.quick_report_failed,
+                    scope=(index,),
+                ),
+            ]
+            for meter in account.meters:
+                steps += self.meter_steps(driver, engine, account, meter, (index,))
+        return steps
+
+    def meter_steps(self, driver, engine, account, meter, account_scope):
+        scope = account_scope + (meter.elm,)
+        steps = [
+            Step(
+                "select_elm",
+                lambda: self.select_elm(driver, account, meter, engine.attempt),
+                done=lambda: driver.find_elements(
+                    By.XPATH,
+                    "//label[contains(text(), 'Množina zařízení')]"
+                    "/ancestor::div[contains(@class, 'form-group')]"
+                    f"//span[@class='multiselect__single' and contains(text(), '{meter.elm}')]",
+                ),
+                timeout=30,
+                retries=9,
+                failed=lambda e: self.select_elm_failed(account, meter),
+                scope=scope,
+            ),
+            Step(
+                "select_yesterday",
+                functools.partial(self.select_yesterday, driver, meter),
+                timeout=30,
+                scope=scope,
+            ),
+        ]
+        exports = []
+        if meter.daily_export:
+            exports.append(
+                (
+                    "daily",
+                    None,
+                    [
+                        (link_text, meter.filename(f"daily-{data_name}.csv"))
+                        for data_name, link_text in PND_DAILY_PROFILES
+                    ],
+                )
+            )
+        for index, (range_from, range_to) in enumerate(meter.ranges):
+            exports.append(
+                (
+                    "interval",
+                    (range_from, range_to),
+                    [
+                        (link_text, meter.filename(range_filename(index, data_name)))
+                        for data_name, link_text in PND_DAILY_PROFILES
+                    ],
+                )
+            )
+        for range_from, range_to in meter.quarter_hour_ranges:
+            month = range_from.replace(day=1)
+            exports.append(
+                (
+                    "interval",
+                    (range_from, range_to),
+                    [
+                        (
+                            link_text,
+                            meter.filename(quarter_hour_filename(month, data_name)),
+                        )
+                        for data_name, link_text in PND_QUARTER_HOUR_PROFILES
+                    ],
+                )
+            )
+        for profile_type, period, files in exports:
+            steps.append(
+                Step(
+                    f"{profile_type}_export",
+                    functools.partial(
+                        self.export_period, driver, meter, profile_type, period, files
+                    ),
+                    done=functools.partial(self.exports_downloaded, files),
+                    timeout=2 * len(files) * self.download_timeout + 60,
+                    scope=scope,
+                )
+            )
+        return steps
+
+    def apply_step_timeout(self, driver, step):
+        # Bounds the blocking page loads and scripts of the step
+        if getattr(driver, "pnd_step_timeout", None) != step.timeout:
+            driver.set_page_load_timeout(step.timeout)
+            driver.set_script_timeout(step.timeout)
+            driver.pnd_step_timeout = step.timeout
+
+    def resume_after_failure(self, step, error):
+        # The failed step set the error status, the run goes on
+        self.set_state_pnd_running(True)
+        self.set_state_pnd_script_status(
+            "Running", f"Opakování kroku {step.name} po chybě: {error}"
+        )
+
+    def exports_downloaded(self, files):
+        return all(
+            os.path.exists(os.path.join(self.download_folder, filename))
+            for _, filename in files
+        )
+
+    def open_account(self, driver, index, account):
+        session_reused = self.driver_account == account.username
+        if self.driver_account is not None and not session_reused:
+            self.reset_browser_session(driver)
+        self.open_portal_session(driver, session_reused, account)
+        if index == 0:
+            # Get PND Portal version
+            self.get_pnd_portal_version(driver)
+
+    def reset_browser_session(self, driver):
+        # Log out the previous account without restarting the browser
+        log("Clearing browser session")
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.execute_script("window.localStorage.clear();")
+        if self.storage_script_id is not None:
+            driver.execute_cdp_cmd(
+                "Page.removeScriptToEvaluateOnNewDocument",
+                {"identifier": self.storage_script_id},
+            )
+            self.storage_script_id = None
+        self.driver_account = None
+
+    def open_portal_session(self, driver, reused, account):
+        restored = not reused and self.restore_browser_session(driver, account)
+        # Load PND Portal
+        self.load_pnd_portal(driver)
+        # Login to PND Portal
+        if (reused or restored) and self.is_logged_in(driver):
+            log(
+                f"{Colors.GREEN}Portal session still valid, skipping login{Colors.RESET}"
+            )
+            if restored:
+                account.session_cache.record(True)
+            self.close_modal_dialog(driver)
+        else:
+            if restored:
+                account.session_cache.record(
+                    False, "cached session rejected by the portal"
+                )
+                account.session_cache.invalidate()
+            self.login_to_pnd_portal(driver, account)
+            self.save_browser_session(driver, account)
+        self.driver_account = account.username
+        self.update_session_cache_metrics()
+
+    @traced("export_form")
+    def open_export_form(self, driver):
+        wait = WebDriverWait(driver, 20)  # 10-second timeout
+        body = driver.find_element(By.TAG_NAME, "body")
         first_pnd_window = wait.until(
             EC.visibility_of_element_located((By.CSS_SELECTOR, ".pnd-window"))
         )
@@ -507,83 +2889,82 @@ class pnd(hass.Hass):
 
         tabulka_dat_button.click()
 
-        body.screenshot(self.download_folder + "/02.png")
+        self.debug.capture(body, "02")
+
+    @traced("quick_report")
+    def select_quick_report(self, driver, attempt):
         # Navigate to the dropdown based on its label "Sestava"
         # Find the label by text, then navigate to the associated dropdown
         wait = WebDriverWait(driver, 2)  # Adjust timeout as necessary
+        body = driver.find_element(By.TAG_NAME, "body")
         option_text = "Rychlá sestava"
-
-        for _ in range(10):
-            dropdown_label = wait.until(
-                EC.visibility_of_element_located(
-                    (By.XPATH, "//label[contains(text(), 'Sestava')]")
-                )
-            )
-            dropdown = dropdown_label.find_element(
-                By.XPATH,
-                "./following-sibling::div//div[contains(@class, 'multiselect__tags')]",
+        dropdown_label = wait.until(
+            EC.visibility_of_element_located(
+                (By.XPATH, "//label[contains(text(), 'Sestava')]")
             )
-            dropdown.click()
+        )
+        dropdown = dropdown_label.find_element(
+            By.XPATH,
+            "./following-sibling::div//div[contains(@class, 'multiselect__tags')]",
+        )
+        dropdown.click()
 
-            # Select the option containing the text
-            option = wait.until(
-                EC.element_to_be_clickable(
-                    (By.XPATH, f"//span[contains(text(), '{option_text}')]")
-                )
+        # Select the option containing the text
+        option = wait.until(
+            EC.element_to_be_clickable(
+                (By.XPATH, f"//span[contains(text(), '{option_text}')]")
             )
-            option.click()
-            body.click()
-            # Check if the span contains "Rychlá sestava"
-            try:
-                wait.until(
-                    EC.text_to_be_present_in_element(
-                        (By.XPATH, "//span[@class='multiselect__single']"),
-                        "Rychlá sestava",
-                    )
+        )
+        option.click()
+        body.click()
+        # Check if the span contains "Rychlá sestava"
+        try:
+            wait.until(
+                EC.text_to_be_present_in_element(
+                    (By.XPATH, "//span[@class='multiselect__single']"),
+                    option_text,
                 )
-                break
-            except TimeoutException:
-                continue
-        else:
-            log(f" {Colors.RED}ERROR: Rychla Sestava neni mozne vybrat!{Colors.RESET}")
-            self.set_state_pnd_running(False)
-            self.set_state_pnd_script_status(
-                "Error",
-                "ERROR: Nebylo možné vybrat 'Rychlá sestava' po 10 pokusech. Zkuste skript spustit později znovu.",
             )
-            raise Exception("Failed to find 'Rychlá sestava' after 10 attempts")
+        except TimeoutException:
+            raise Exception(f"'{option_text}' not selected (attempt {attempt + 1})")
         log(f"{Colors.GREEN}Rychla Sestava selected successfully!{Colors.RESET}")
-        body.screenshot(self.download_folder + "/03.png")
+        self.debug.capture(body, "03")
 
-        # Check the input field value
-        time.sleep(1)  # Allow any JavaScript updates
-
-        log(f"Selecting ELM '{self.ELM}'")
-
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        dropdown_label = wait.until(
-            EC.visibility_of_element_located(
-                (By.XPATH, "//label[contains(text(), 'Množina zařízení')]")
-            )
-        )
-        parent_element = dropdown_label.find_element(
-            By.XPATH, ".//ancestor::div[contains(@class, 'form-group')]"
-        )
-        text = parent_element.get_attribute("outerHTML")
-        elm_spans = soup.find_all(
-            "span",
-            class_="multiselect__option",
-            text=lambda text: text and text.startswith("ELM"),
+    def quick_report_failed(self, error):
+        log(f" {Colors.RED}ERROR: Rychla Sestava neni mozne vybrat!{Colors.RESET}")
+        self.set_state_pnd_running(False)
+        self.set_state_pnd_script_status(
+            "Error",
+            "ERROR: Nebylo možné vybrat 'Rychlá sestava' po 10 pokusech. Zkuste skript spustit později znovu.",
         )
-        elm_values = [span.text for span in elm_spans]
-        elm_values_string = ", ".join(elm_values)
-        log(f"Valid ELM numbers '{elm_values_string}'")
+
+    @traced("elm_discovery")
+    def discover_elms(self, driver, parent_element, account, meter):
+        if account.elm_cache.contains(meter.elm):
+            log(f"ELM '{meter.elm}' is known to be valid, skipping discovery")
+        else:
+            elm_values = driver.execute_script(ELM_OPTIONS_SCRIPT, parent_element)
+            account.elm_cache.save(elm_values)
+            log(f"Valid ELM numbers '{', '.join(elm_values)}'")
+            if not account.elm_cache.contains(meter.elm):
+                log(
+                    f"{Colors.YELLOW}ELM '{meter.elm}' is not among the valid ELM numbers{Colors.RESET}"
+                )
+        self.status_attributes["valid_elms"] = [
+            elm for a in self.accounts for elm in (a.elm_cache.elms or [])
+        ]
+
+    @traced("select_elm")
+    def select_elm(self, driver, account, meter, attempt):
+        if attempt == 0:
+            self.set_phase(f"downloading {meter.elm}")
+            log(f"{Colors.CYAN}Downloading data for ELM '{meter.elm}'{Colors.RESET}")
+        wait = WebDriverWait(driver, 2)
+        body = driver.find_element(By.TAG_NAME, "body")
+        log(f"Selecting ELM '{meter.elm}'")
 
         # Navigate to the dropdown based on its label "Množina zařízení"
         # Find the label by text, then navigate to the associated dropdown
-        with open(self.download_folder + "/debug-ELM.txt", "w") as file:
-            file.write(">>>Debug ELM<<<" + "\n")
-        wait = WebDriverWait(driver, 2)
         dropdown_label = wait.until(
             EC.visibility_of_element_located(
                 (By.XPATH, "//label[contains(text(), 'Množina zařízení')]")
@@ -592,82 +2973,83 @@ class pnd(hass.Hass):
         parent_element = dropdown_label.find_element(
             By.XPATH, ".//ancestor::div[contains(@class, 'form-group')]"
         )
-        # log(f"{Colors.CYAN}{parent_element.get_attribute('outerHTML')}{Colors.RESET}")
-        with open(self.download_folder + "/debug-ELM.txt", "a") as file:
-            file.write(parent_element.get_attribute("outerHTML") + "\n")
+        debug_file = f"{meter.prefix}debug-ELM.txt"
+        if attempt == 0:
+            self.discover_elms(driver, parent_element, account, meter)
+            self.debug.note(debug_file, ">>>Debug ELM<<<")
+            if self.debug.level == "always":
+                self.debug.note(debug_file, parent_element.get_attribute("outerHTML"))
         dropdown = dropdown_label.find_element(
             By.XPATH,
             "./following-sibling::div//div[contains(@class, 'multiselect__select')]",
         )  # Adjusted to the next input field within a sibling div
 
-        for i in range(10):
-            dropdown.click()  # Open the dropdown
-            time.sleep(1)
-            body.screenshot(self.download_folder + f"/03-{i}-a.png")
-            try:
-                option = wait.until(
-                    EC.element_to_be_clickable(
-                        (By.XPATH, f"//span[contains(text(), '{self.ELM}')]")
-                    )
-                )
-            except:
-                log(
-                    f"{Colors.RED}ERROR: Failed to find '{self.ELM}' in the selection - check ELM attribute in the apps.yaml{Colors.RESET}"
-                )
-                self.set_state_pnd_running(False)
-                self.set_state_pnd_script_status(
-                    "Error",
-                    f"ERROR: Nebylo možné najít '{self.ELM}' v nabídce. Zkontrolujte ELM atribut v nastavení aplikace.",
+        dropdown.click()  # Open the dropdown
+        self.worker.sleep(1)
+        self.debug.capture(body, f"{meter.prefix}03-{attempt}-a")
+        try:
+            option = wait.until(
+                EC.element_to_be_clickable(
+                    (By.XPATH, f"//span[contains(text(), '{meter.elm}')]")
                 )
-                raise Exception(f"Failed to find '{self.ELM}' in the selection")
-            option.click()
-            body.screenshot(self.download_folder + f"/03-{i}-b.png")
-            body.click()
-            button = driver.find_element(
-                By.XPATH, "//button[contains(., 'Vyhledat data')]"
             )
-            class_attribute = button.get_attribute("class")
-            try:
-                span = parent_element.find_element(
-                    By.XPATH, ".//span[@class='multiselect__single']"
-                ).text
-            except:
-                span = ""
-            log(f"{Colors.CYAN}ELM Status: {span} - {self.ELM}{Colors.RESET}")
-            # if 'disabled' not in class_attribute:
-            parent_element = dropdown_label.find_element(
-                By.XPATH, ".//ancestor::div[contains(@class, 'form-group')]"
-            )
-            with open(self.download_folder + "/debug-ELM.txt", "a") as file:
-                file.write(f">>>Iteration {i}<<<" + "\n")
-            with open(self.download_folder + "/debug-ELM.txt", "a") as file:
-                file.write("ELM Span content: " + span + "\n")
-            with open(self.download_folder + "/debug-ELM.txt", "a") as file:
-                file.write(parent_element.get_attribute("outerHTML") + "\n")
-            if "disabled" not in class_attribute and span.strip() != "":
-                log(
-                    f"{Colors.GREEN}Iteration {i}: Vyhledat Button NOT disabled{Colors.RESET}"
-                )
-                break
-            else:
-                log(
-                    f"{Colors.YELLOW}Iteration {i}: Vyhledat Button IS disabled{Colors.RESET}"
-                )
-        else:
+        except:
             log(
-                f" {Colors.RED}ERROR: Failed to find '{self.ELM}' after 10 attempts{Colors.RESET}"
+                f"{Colors.RED}ERROR: Failed to find '{meter.elm}' in the selection - check ELM attribute in the apps.yaml{Colors.RESET}"
             )
             self.set_state_pnd_running(False)
             self.set_state_pnd_script_status(
                 "Error",
-                f"ERROR: Nebylo možné najít '{self.ELM}' po 10 pokusech. Zkontrolujte ELM atribut v nastavení aplikace.",
+                f"ERROR: Nebylo možné najít '{meter.elm}' v nabídce. Zkontrolujte ELM atribut v nastavení aplikace.",
+            )
+            account.elm_cache.invalidate()
+            raise PortalError(f"Failed to find '{meter.elm}' in the selection")
+        option.click()
+        self.debug.capture(body, f"{meter.prefix}03-{attempt}-b")
+        body.click()
+        button = driver.find_element(By.XPATH, "//button[contains(., 'Vyhledat data')]")
+        class_attribute = button.get_attribute("class")
+        try:
+            span = parent_element.find_element(
+                By.XPATH, ".//span[@class='multiselect__single']"
+            ).text
+        except:
+            span = ""
+        log(f"{Colors.CYAN}ELM Status: {span} - {meter.elm}{Colors.RESET}")
+        parent_element = dropdown_label.find_element(
+            By.XPATH, ".//ancestor::div[contains(@class, 'form-group')]"
+        )
+        self.debug.note(debug_file, f">>>Iteration {attempt}<<<")
+        self.debug.note(debug_file, "ELM Span content: " + span)
+        if self.debug.level == "always":
+            self.debug.note(debug_file, parent_element.get_attribute("outerHTML"))
+        if "disabled" in class_attribute or span.strip() == "":
+            log(
+                f"{Colors.YELLOW}Iteration {attempt}: Vyhledat Button IS disabled{Colors.RESET}"
             )
-            raise Exception(f"Failed to find '{self.ELM}' after 10 attempts")
+            raise Exception(f"ELM '{meter.elm}' not selected yet")
         log(
-            f"{Colors.GREEN}Device ELM '{self.ELM}' selected successfully!{Colors.RESET}"
+            f"{Colors.GREEN}Iteration {attempt}: Vyhledat Button NOT disabled{Colors.RESET}"
         )
-        body.screenshot(self.download_folder + "/04.png")
+        log(
+            f"{Colors.GREEN}Device ELM '{meter.elm}' selected successfully!{Colors.RESET}"
+        )
+        self.debug.capture(body, f"{meter.prefix}04")
 
+    def select_elm_failed(self, account, meter):
+        log(
+            f" {Colors.RED}ERROR: Failed to find '{meter.elm}' after 10 attempts{Colors.RESET}"
+        )
+        self.set_state_pnd_running(False)
+        self.set_state_pnd_script_status(
+            "Error",
+            f"ERROR: Nebylo možné najít '{meter.elm}' po 10 pokusech. Zkontrolujte ELM atribut v nastavení aplikace.",
+        )
+        account.elm_cache.invalidate()
+
+    @traced("select_yesterday")
+    def select_yesterday(self, driver, meter):
+        body = driver.find_element(By.TAG_NAME, "body")
         # Navigate to the dropdown based on its label "Období"
         # Use the label text to find the dropdown button
         try:
@@ -702,7 +3084,7 @@ class pnd(hass.Hass):
                 "Error", "ERROR: Nepodařilo se vybrat 'Včera' v nabídce"
             )
             raise Exception("Failed to select 'Včera' in the dropdown")
-        body.screenshot(self.download_folder + "/05.png")
+        self.debug.capture(body, f"{meter.prefix}05")
         # Check for the presence of the button and then check if it's clickable
         try:
             button = wait.until(
@@ -724,52 +3106,31 @@ class pnd(hass.Hass):
                 "ERROR: Nepodařilo se nalézt nebo kliknout na tlačítko 'Vyhledat data'",
             )
             raise Exception("Failed to find or click the 'Vyhledat data' button")
-        body.screenshot(self.download_folder + "/06.png")
-        time.sleep(2)
+        self.debug.capture(body, f"{meter.prefix}06")
+        self.worker.sleep(2)
         body.click()
 
-        # ------------------DOWNLOAD DAILY DATA-----------------------------
-        profile_type = "daily"
-        # daily consumption
-        link_text = "07 Profil spotřeby za den (+A)"
-        image_id = "07"
-        self.select_export_profile(driver, profile_type, link_text, image_id)
-        self.download_export_file(driver, profile_type, link_text)
-        self.rename_downloaded_file("daily-consumption.csv", link_text)
-        # daily production
-        link_text = "08 Profil výroby za den (-A)"
-        image_id = "08"
-        self.select_export_profile(driver, profile_type, link_text, image_id)
-        self.download_export_file(driver, profile_type, link_text)
-        self.rename_downloaded_file("daily-production.csv", link_text)
-        log("All Done - DAILY DATA DOWNLOADED")
-
-        # ------------------PROCESS DAILY DATA-----------------------------
-        for data_name in ["consumption", "production"]:
-            data_pd = pd.read_csv(
-                self.download_folder + f"/daily-{data_name}.csv",
-                delimiter=";",
-                encoding="latin1",
-            )
-            last_row = data_pd.iloc[-1]
-            entry_date, entry_value = last_row.iloc[0], last_row.iloc[1]
-            log(
-                f"{Colors.GREEN}Latest {data_name} entry: {entry_date} - {entry_value} kWh{Colors.RESET}"
-            )
-            self.set_state(
-                f"sensor.pnd_{data_name}{self.suffix}",
-                state=entry_value,
-                attributes={
-                    "friendly_name": f"PND {data_name.capitalize()}",
-                    "device_class": "energy",
-                    "unit_of_measurement": "kWh",
-                    "date": (conv_date(entry_date) - timedelta(days=1)).isoformat(),
-                },
-            )
-
-        log("All Done - DAILY DATA PROCESSED")
+    def export_period(self, driver, meter, profile_type, period, files):
+        # Only the files still missing after a failed attempt are downloaded
+        if period is not None:
+            self.select_interval_range(driver, *period)
+        self.download_exports(
+            driver,
+            profile_type,
+            [
+                (link_text, filename)
+                for link_text, filename in files
+                if not os.path.exists(os.path.join(self.download_folder, filename))
+            ],
+        )
+        if profile_type == "daily":
+            log("All Done - DAILY DATA DOWNLOADED")
 
+    @traced("interval_range")
+    def select_interval_range(self, driver, range_from, range_to):
         # ------------------INTERVAL-----------------------------
+        wait = WebDriverWait(driver, 2)
+        body = driver.find_element(By.TAG_NAME, "body")
         ## Use the label text to find the dropdown button
         try:
             dropdown_label = wait.until(
@@ -808,7 +3169,7 @@ class pnd(hass.Hass):
             input_field.clear()
 
             # Enter the date range into the input field
-            date_range = self.datainterval
+            date_range = f"{range_from:%d.%m.%Y %H:%M} - {range_to:%d.%m.%Y %H:%M}"
             input_field.send_keys(date_range)
 
             # Optionally, you can send ENTER or TAB if needed to process the input
@@ -826,16 +3187,16 @@ class pnd(hass.Hass):
             )
             raise Exception("Failed to select 'Vlastní období' in the dropdown")
         # Confirmation output (optional)
-        log(f"Data Interval Entered - '{self.datainterval}'")
+        log(f"Data Interval Entered - '{date_range}'")
         # -----------------------------------------------
-        time.sleep(1)
+        self.worker.sleep(1)
         try:
             tabulka_dat_button = wait.until(
                 EC.element_to_be_clickable((By.XPATH, "//button[@title='Tabulka dat']"))
             )
             # Click the button
             tabulka_dat_button.click()
-            time.sleep(1)
+            self.worker.sleep(1)
             tabulka_dat_button = wait.until(
                 EC.element_to_be_clickable((By.XPATH, "//button[@title='Export']"))
             )
@@ -853,64 +3214,393 @@ class pnd(hass.Hass):
             )
             raise Exception("Failed to click 'Tabulka dat' button")
 
-        # ------------------DOWNLOAD INTERVAL DATA-----------------------------
-        profile_type = "interval"
-        # interval consumption
-        link_text = "07 Profil spotřeby za den (+A)"
-        image_id = "07"
-        # ----------------------------------------------
-        self.select_export_profile(driver, profile_type, link_text, image_id)
-        self.download_export_file(driver, profile_type, link_text)
-        self.rename_downloaded_file("range-consumption.csv", link_text)
-        # interval production
-        link_text = "08 Profil výroby za den (-A)"
-        image_id = "08"
-        self.select_export_profile(driver, profile_type, link_text, image_id)
-        self.download_export_file(driver, profile_type, link_text)
-        self.rename_downloaded_file("range-production.csv", link_text)
-        log("All Done - INTERVAL DATA DOWNLOADED")
+    def data_interval(self):
+        # DataIntervalDays is a rolling window ending yesterday
+        if self.data_interval_days:
+            today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            return today - timedelta(days=int(self.data_interval_days)), today
+        return parse_data_interval(self.datainterval)
+
+    def interval_covers_yesterday(self):
+        interval_from, interval_to = self.data_interval()
+        today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return interval_from <= today - timedelta(days=1) and interval_to >= today
+
+    def yesterday_entries(self, meter):
+        # {data_name: (end of the period, kWh)} for the daily sensors
+        if meter.daily_export:
+            entries = {}
+            for data_name in HistoryStore.COLUMNS:
+                data_pd = read_pnd_csv(
+                    os.path.join(
+                        self.download_folder, meter.filename(f"daily-{data_name}.csv")
+                    ),
+                    self.csv_engine,
+                )
+                entries[data_name] = (
+                    data_pd["timestamp"].iloc[-1],
+                    data_pd["value"].iloc[-1],
+                )
+            return entries
+        yesterday = dt.now().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        ) - timedelta(days=1)
+        if self.history is not None:
+            rows = self.history.daily_series(
+                meter.elm, yesterday.date(), yesterday.date()
+            )
+            values = dict(zip(HistoryStore.COLUMNS, rows[0][1:])) if rows else {}
+        else:
+            values = {}
+            for data_name in HistoryStore.COLUMNS:
+                data_pd = read_pnd_csv(
+                    os.path.join(
+                        self.download_folder,
+                        meter.filename(range_filename(0, data_name)),
+                    ),
+                    self.csv_engine,
+                )
+                days = period_days(data_pd["timestamp"])
+                matching = data_pd["value"][days == pd.Timestamp(yesterday)]
+                if len(matching):
+                    values[data_name] = matching.iloc[-1]
+        return {
+            data_name: (yesterday + timedelta(days=1), value)
+            for data_name, value in values.items()
+            if value is not None and not math.isnan(value)
+        }
+
+    @traced("process_daily")
+    def process_daily_data(self, meter):
+        # ------------------PROCESS DAILY DATA-----------------------------
+        entries = self.yesterday_entries(meter)
+        today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        complete = True
+        for data_name in HistoryStore.COLUMNS:
+            if data_name not in entries:
+                log(
+                    f"{Colors.YELLOW}No {data_name} value for yesterday in the interval data yet{Colors.RESET}"
+                )
+                complete = False
+                continue
+            entry_date, entry_value = entries[data_name]
+            if entry_date != today or pd.isna(entry_value):
+                complete = False
+            log(
+                f"{Colors.GREEN}Latest {data_name} entry: {entry_date} - {entry_value} kWh{Colors.RESET}"
+            )
+            self.publish_state(
+                f"sensor.pnd_{data_name}{meter.suffix}",
+                state=entry_value,
+                attributes={
+                    "friendly_name": f"PND {data_name.capitalize()}",
+                    "device_class": "energy",
+                    "unit_of_measurement": "kWh",
+                    "date": (entry_date - timedelta(minutes=1))
+                    .replace(hour=0, minute=0)
+                    .isoformat(),
+                },
+            )
 
-        # ------------------PROCESS INTERVAL DATA-----------------------------
-        data_consumption = pd.read_csv(
-            self.download_folder + "/range-consumption.csv",
-            delimiter=";",
-            encoding="latin1",
-            converters={
-                0: lambda s: dt.strptime(
-                    s.replace("24:00:00", "23:59:00"), "%d.%m.%Y %H:%M:%S"
+        log("All Done - DAILY DATA PROCESSED")
+        return complete
+
+    @traced("plan_ranges")
+    def interval_ranges(self, meter):
+        interval_from, interval_to = self.data_interval()
+        if self.history is None:
+            return [(interval_from, interval_to)]
+        today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        last_day = (min(interval_to, today) - timedelta(days=1)).date()
+        ranges = [
+            (to_midnight(first_day), to_midnight(last) + timedelta(days=1))
+            for first_day, last in self.history.missing_ranges(
+                meter.elm, interval_from.date(), last_day
+            )
+        ]
+        if ranges:
+            log(
+                f"History store: requesting for ELM '{meter.elm}' "
+                + ", ".join(f"{a:%d.%m.%Y} - {b:%d.%m.%Y}" for a, b in ranges)
+            )
+        else:
+            log(
+                f"{Colors.GREEN}History store is up to date, skipping interval download{Colors.RESET}"
+            )
+        return ranges
+
+    @traced("plan_quarter_hour")
+    def quarter_hour_ranges(self, meter):
+        if self.quarter_hour is None:
+            return []
+        interval_from, interval_to = self.data_interval()
+        today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        last = min(interval_to, today)
+        ranges = [
+            (max(month, interval_from), min(next_month, last))
+            for month, next_month in self.quarter_hour.missing_months(
+                meter.elm, interval_from.date(), (last - timedelta(days=1)).date()
+            )
+        ]
+        if ranges:
+            log(
+                f"Quarter-hour profile: requesting for ELM '{meter.elm}' "
+                + ", ".join(f"{a:%d.%m.%Y} - {b:%d.%m.%Y}" for a, b in ranges)
+            )
+        return ranges
+
+    @traced("process_quarter_hour")
+    def process_quarter_hour_data(self, meter):
+        for range_from, _ in meter.quarter_hour_ranges:
+            month = range_from.replace(day=1)
+            frames = {
+                data_name: read_pnd_csv(
+                    os.path.join(
+                        self.download_folder,
+                        meter.filename(quarter_hour_filename(month, data_name)),
+                    ),
+                    self.csv_engine,
                 )
-            },
+                for data_name, _ in PND_QUARTER_HOUR_PROFILES
+            }
+            for data_name, frame in frames.items():
+                if not is_sub_daily(frame["timestamp"]):
+                    raise PortalError(
+                        f"The {data_name} export for {month:%m/%Y} is not a quarter-hour profile"
+                    )
+            rows = self.quarter_hour.save(meter.elm, month, frames)
+            log(f"Stored {rows} quarter-hour intervals for {month:%m/%Y}")
+        interval_from, interval_to = self.data_interval()
+        ts, columns = self.quarter_hour.load(
+            meter.elm, interval_from.date(), (interval_to - timedelta(days=1)).date()
         )
-        data_production = pd.read_csv(
-            self.download_folder + "/range-production.csv",
-            delimiter=";",
-            encoding="latin1",
-            converters={
-                0: lambda s: dt.strptime(
-                    s.replace("24:00:00", "23:59:00"), "%d.%m.%Y %H:%M:%S"
-                )
-            },
+        summary = quarter_hour_summary(ts, columns)
+        self.publish_state(
+            f"sensor.pnd_quarter_hour{meter.suffix}",
+            state=summary.get("last", "unknown"),
+            attributes={"friendly_name": "PND Quarter-hour Profile", **summary},
+        )
+        if self.low_tariff is not None:
+            self.publish_tariff_split(meter, ts, columns["consumption"])
+        if self.output_mode in ("statistics", "both"):
+            hours, hourly = hourly_sums(
+                ts,
+                {
+                    f"{data_name}_hourly": values
+                    for data_name, values in columns.items()
+                },
+            )
+            self.publish_statistics(meter, hours, hourly)
+
+    @traced("tariff_split")
+    def publish_tariff_split(self, meter, ts, consumption):
+        days, high, low = tariff_split(
+            ts, consumption, low_tariff_minutes(self.low_tariff)
         )
+        totals = {}
+        for tariff, series in (("high", high), ("low", low)):
+            totals[tariff] = round(sum(series), 3)
+            attributes = {
+                "friendly_name": f"PND Consumption {tariff.capitalize()} Tariff",
+                "device_class": "energy",
+                "unit_of_measurement": "kWh",
+                "pnddate": days,
+                "consumption": series,
+            }
+            if self.tariff_prices:
+                price = self.tariff_prices[tariff]
+                attributes["price"] = price
+                attributes["cost"] = round(totals[tariff] * price, 2)
+            self.publish_state(
+                f"sensor.pnd_consumption_{tariff}_tariff{meter.suffix}",
+                state=totals[tariff],
+                attributes=attributes,
+            )
+        if self.tariff_prices:
+            high_price = self.tariff_prices["high"]
+            low_price = self.tariff_prices["low"]
+            self.publish_state(
+                f"sensor.pnd_consumption_cost{meter.suffix}",
+                state=round(totals["high"] * high_price + totals["low"] * low_price, 2),
+                attributes={
+                    "friendly_name": "PND Consumption Cost",
+                    "unit_of_measurement": self.tariff_prices["currency"],
+                    "pnddate": days,
+                    "cost": [
+                        round(h * high_price + l * low_price, 2)
+                        for h, l in zip(high, low)
+                    ],
+                },
+            )
+        log(f"Tariff split: {totals['high']} kWh high, {totals['low']} kWh low tariff")
+
+    @traced("history_store")
+    def store_interval_data(self, meter):
+        for index, (range_from, range_to) in enumerate(meter.ranges):
+            self.history.mark_fetched(
+                meter.elm, range_from.date(), (range_to - timedelta(days=1)).date()
+            )
+            for data_name in HistoryStore.COLUMNS:
+                data_pd = read_pnd_csv(
+                    os.path.join(
+                        self.download_folder,
+                        meter.filename(range_filename(index, data_name)),
+                    ),
+                    self.csv_engine,
+                )
+                days = period_days(data_pd["timestamp"]).dt.strftime("%Y-%m-%d")
+                values = data_pd["value"].astype(object)
+                values = values.where(values.notna(), None)
+                self.history.upsert_daily(
+                    meter.elm, data_name, zip(days.to_list(), values.to_list())
+                )
+
+    def statistic_id(self, meter, data_name):
+        return f"pnd:{data_name}{meter.suffix}".lower()
+
+    @traced("publish_statistics")
+    def publish_statistics(self, meter, date_str, values):
+        if not self.ha_url or not self.ha_token:
+            log(
+                f"{Colors.RED}ERROR: OutputMode statistics requires HAURL and HAToken{Colors.RESET}"
+            )
+            return
+        state_path = os.path.join(self.state_folder, "statistics.json")
+        imported_all = {}
+        if os.path.exists(state_path):
+            try:
+                with open(state_path) as file:
+                    imported_all = json.load(file)
+            except (OSError, ValueError) as e:
+                # The statistics are imported again from scratch
+                log(f"Failed to read the imported statistics. Reason: {e}")
+        try:
+            client = HomeAssistantWebSocket(self.ha_url, self.ha_token)
+        except Exception as e:
+            log(
+                f"{Colors.RED}ERROR: Unable to connect to Home Assistant: {e}{Colors.RESET}"
+            )
+            return
+        try:
+            for data_name, data_values in values.items():
+                statistic_id = self.statistic_id(meter, data_name)
+                imported = imported_all.setdefault(statistic_id, {})
+                series = [
+                    (day, float(value))
+                    for day, value in zip(date_str, data_values)
+                    if value is not None and not math.isnan(value)
+                ]
+                rows = plan_statistics_import(imported, series)
+                if not rows:
+                    log(f"Statistics {statistic_id} already up to date")
+                    continue
+                client.call(
+                    "recorder/import_statistics",
+                    metadata={
+                        "has_mean": False,
+                        "has_sum": True,
+                        "name": f"PND {data_name.replace('_', ' ').capitalize()}{meter.suffix}",
+                        "source": "pnd",
+                        "statistic_id": statistic_id,
+                        "unit_of_measurement": "kWh",
+                    },
+                    stats=[
+                        {
+                            "start": dt.fromisoformat(day).astimezone().isoformat(),
+                            "state": value,
+                            "sum": running_sum,
+                        }
+                        for day, value, running_sum in rows
+                    ],
+                )
+                imported.update({day: [value, total] for day, value, total in rows})
+                log(
+                    f"{Colors.GREEN}Imported {len(rows)} statistics rows into {statistic_id}{Colors.RESET}"
+                )
+        except Exception as e:
+            log(f"{Colors.RED}ERROR: Failed to import statistics: {e}{Colors.RESET}")
+        finally:
+            client.close()
+            os.makedirs(self.state_folder, exist_ok=True)
+            partial_path = state_path + ".part"
+            with open(partial_path, "w") as file:
+                json.dump(imported_all, file)
+            os.replace(partial_path, state_path)
+
+    @traced("process_interval")
+    def process_interval_data(self, meter):
+        # ------------------PROCESS INTERVAL DATA-----------------------------
+        if self.history is not None:
+            self.store_interval_data(meter)
+            interval_from, interval_to = self.data_interval()
+            rows = self.history.daily_series(
+                meter.elm,
+                interval_from.date(),
+                (interval_to - timedelta(days=1)).date(),
+            )
+            date_str = [row[0] for row in rows]
+            consumption_str = [row[1] for row in rows]
+            production_str = [row[2] for row in rows]
+        else:
+            data_consumption = read_pnd_csv(
+                os.path.join(
+                    self.download_folder, meter.filename("range-consumption.csv")
+                ),
+                self.csv_engine,
+            )
+            data_production = read_pnd_csv(
+                os.path.join(
+                    self.download_folder, meter.filename("range-production.csv")
+                ),
+                self.csv_engine,
+            )
 
-        date_str = [_dt.date().isoformat() for _dt in data_consumption.iloc[:, 0]]
+            date_str = (
+                period_days(data_consumption["timestamp"])
+                .dt.strftime("%Y-%m-%d")
+                .to_list()
+            )
 
-        consumption_str = data_consumption.iloc[:, 1].to_list()
-        production_str = data_production.iloc[:, 1].to_list()
+            consumption_str = data_consumption["value"].to_list()
+            production_str = data_production["value"].to_list()
 
         now = dt.now()
-        self.set_state(
-            f"sensor.pnd_data{self.suffix}",
-            state=now.strftime("%Y-%m-%d %H:%M:%S"),
-            attributes={
+        if self.output_mode in ("attributes", "both"):
+            data_attributes = {
                 "pnddate": date_str,
                 "consumption": consumption_str,
                 "production": production_str,
-            },
+            }
+        else:
+            data_attributes = {
+                "first_date": date_str[0] if date_str else None,
+                "last_date": date_str[-1] if date_str else None,
+                "days": len(date_str),
+                "statistic_ids": [
+                    self.statistic_id(meter, data_name)
+                    for data_name in HistoryStore.COLUMNS
+                ],
+            }
+        # The state is the time of the last change, a run with the same data
+        # leaves it as it was
+        self.publish_state(
+            f"sensor.pnd_data{meter.suffix}",
+            state=now.strftime("%Y-%m-%d %H:%M:%S"),
+            attributes=data_attributes,
+            ignore_state=True,
         )
-        total_consumption = "{:.2f}".format(data_consumption.iloc[:, 1].sum())
-        total_production = "{:.2f}".format(data_production.iloc[:, 1].sum())
-        self.set_state(
-            f"sensor.pnd_total_interval_consumption{self.suffix}",
+        if self.output_mode in ("statistics", "both"):
+            self.publish_statistics(
+                meter,
+                date_str,
+                {"consumption": consumption_str, "production": production_str},
+            )
+        if self.aggregates:
+            self.publish_aggregates(meter, date_str, consumption_str, production_str)
+        total_consumption = "{:.2f}".format(sum_kwh(consumption_str))
+        total_production = "{:.2f}".format(sum_kwh(production_str))
+        self.publish_state(
+            f"sensor.pnd_total_interval_consumption{meter.suffix}",
             state=total_consumption,
             attributes={
                 "friendly_name": "PND Total Interval Consumption",
@@ -918,8 +3608,8 @@ class pnd(hass.Hass):
                 "unit_of_measurement": "kWh",
             },
         )
-        self.set_state(
-            f"sensor.pnd_total_interval_production{self.suffix}",
+        self.publish_state(
+            f"sensor.pnd_total_interval_production{meter.suffix}",
             state=total_production,
             attributes={
                 "friendly_name": "PND Total Interval Production",
@@ -935,8 +3625,8 @@ class pnd(hass.Hass):
             percentage_diff = 0
         capped_percentage_diff = round(min(percentage_diff, 100), 2)
         floored_min_percentage_diff = round(max(percentage_diff - 100, 0), 2)
-        self.set_state(
-            f"sensor.pnd_production2consumption{self.suffix}",
+        self.publish_state(
+            f"sensor.pnd_production2consumption{meter.suffix}",
             state=capped_percentage_diff,
             attributes={
                 "friendly_name": "PND Interval Production to Consumption Max",
@@ -944,8 +3634,8 @@ class pnd(hass.Hass):
                 "unit_of_measurement": "%",
             },
         )
-        self.set_state(
-            f"sensor.pnd_production2consumptionfull{self.suffix}",
+        self.publish_state(
+            f"sensor.pnd_production2consumptionfull{meter.suffix}",
             state=percentage_diff,
             attributes={
                 "friendly_name": "PND Interval Production to Consumption Full",
@@ -953,8 +3643,8 @@ class pnd(hass.Hass):
                 "unit_of_measurement": "%",
             },
         )
-        self.set_state(
-            f"sensor.pnd_production2consumptionfloor{self.suffix}",
+        self.publish_state(
+            f"sensor.pnd_production2consumptionfloor{meter.suffix}",
             state=floored_min_percentage_diff,
             attributes={
                 "friendly_name": "PND Interval Production to Consumption Floor",
@@ -965,20 +3655,237 @@ class pnd(hass.Hass):
         # ----------------------------------------------
         log("All Done - INTERVAL DATA PROCESSED")
 
-        # Close the browser
-        quit_driver(driver)
-        log("All Done - BROWSER CLOSED")
-        self.set_state_pnd_running(False)
-        log("Sensor State Set to OFF")
-        zip_folder(
-            f"/homeassistant/appdaemon/apps/pnd{self.suffix}",
-            f"/homeassistant/appdaemon/apps/debug{self.suffix}.zip",
+    @traced("aggregates")
+    def publish_aggregates(self, meter, date_str, consumption, production):
+        # Pre-bucketed series, dashboards chart them without regrouping the days
+        bucket_starts = dict(AGGREGATE_BUCKETS)
+        if self.billing_start is not None:
+            bucket_starts["billing_period"] = functools.partial(
+                billing_period_starts,
+                start_day=self.billing_start[0],
+                start_month=self.billing_start[1],
+            )
+        buckets = {
+            name: aggregate_daily(date_str, consumption, production, starts)
+            for name, starts in bucket_starts.items()
+        }
+        for name, aggregate in buckets.items():
+            latest = aggregate["consumption"][-1] if aggregate["period"] else None
+            self.publish_state(
+                f"sensor.pnd_{name}{meter.suffix}",
+                state=latest,
+                attributes={
+                    "friendly_name": f"PND {name.replace('_', ' ').capitalize()}",
+                    "device_class": "energy",
+                    "unit_of_measurement": "kWh",
+                    **aggregate,
+                },
+            )
+        log(f"Aggregates published: {', '.join(buckets)}")
+
+    def run_pnd(self, event_name, data, kwargs):
+        # The scrape runs on the worker thread, the event callback returns at once
+        if self.worker.submit("run_pnd"):
+            log(f"Run queued, queue depth {self.worker.depth}")
+        else:
+            log("Run already queued, request coalesced")
+
+    def cancel_pnd(self, event_name, data, kwargs):
+        dropped = self.worker.cancel()
+        log(
+            f"{Colors.YELLOW}Cancel requested, {dropped} queued run(s) dropped{Colors.RESET}"
         )
-        shutil.move(
-            f"/homeassistant/appdaemon/apps/debug{self.suffix}.zip",
-            self.download_folder + "/debug.zip",
+
+    def plan_scheduled_run(self, kwargs):
+        # Daily at ScheduleTime: start the run when yesterday is usually published
+        yesterday = (dt.now() - timedelta(days=1)).date()
+        if self.schedule.done(yesterday):
+            log("Scheduler: yesterday is already downloaded")
+            return
+        self.schedule_attempt = 0
+        delay = max(0, self.schedule.start_time() - seconds_of_day(dt.now()))
+        self.schedule_run_in(delay)
+
+    def schedule_run_in(self, delay):
+        if self.schedule_timer is not None:
+            self.cancel_timer(self.schedule_timer)
+        self.schedule_timer = self.run_in(self.scheduled_run, delay)
+        next_run = dt.now() + timedelta(seconds=delay)
+        log(f"Scheduler: next run at {next_run:%d.%m.%Y %H:%M:%S}")
+        self.status_attributes["next_run"] = next_run.isoformat(timespec="seconds")
+        publication_time = self.schedule.publication_time
+        if publication_time is not None:
+            self.status_attributes["publication_time"] = format_seconds_of_day(
+                publication_time
+            )
+        self.publish_worker_state()
+
+    def scheduled_run(self, kwargs):
+        self.schedule_timer = None
+        self.status_attributes.pop("next_run", None)
+        self.worker.submit("scheduled")
+
+    def yesterday_stored(self):
+        yesterday = (dt.now() - timedelta(days=1)).date()
+        if self.schedule.done(yesterday):
+            return True
+        return self.history is not None and not any(
+            self.history.missing_ranges(meter.elm, yesterday, yesterday)
+            for meter in self.meters
         )
-        log("Debug Files Zipped")
+
+    def schedule_next(self, status):
+        yesterday = (dt.now() - timedelta(days=1)).date()
+        now = seconds_of_day(dt.now())
+        if status == "ok" and self.yesterday_complete:
+            self.schedule.record_published(yesterday, now)
+            log(
+                "Scheduler: yesterday published, usual publication time "
+                + format_seconds_of_day(self.schedule.publication_time)
+            )
+            return
+        if status == "cancelled":
+            log("Scheduler: run cancelled, waiting for the next day")
+            return
+        if status == "rejected":
+            # E.g. wrong credentials, retrying would only lock the account
+            log(
+                f"{Colors.RED}Scheduler: the portal rejected the run, waiting for the next day{Colors.RESET}"
+            )
+            return
+        if status == "ok":
+            # The run worked but the portal has not published yesterday yet
+            self.schedule.record_unpublished(yesterday, now)
+        if self.schedule_attempt >= self.schedule_retries:
+            log(
+                f"{Colors.RED}Scheduler: giving up after {self.schedule_attempt} retries{Colors.RESET}"
+            )
+            return
+        delay = self.schedule.retry_delay(self.schedule_attempt)
+        self.schedule_attempt += 1
+        self.schedule_run_in(delay)
+
+    def run_job(self, job):
+        if job == "scheduled" and self.yesterday_stored():
+            # Nothing new on the portal, the browser is not started at all
+            log("Scheduler: yesterday is already stored, run skipped")
+            self.schedule.mark_done((dt.now() - timedelta(days=1)).date())
+            return
+        self.trace.reset()
+        self.yesterday_complete = False
+        self.skipped_writes = 0
+        status = "error"
+        try:
+            self.run_scrape()
+            status = "ok"
+        except Exception as e:
+            self.set_state_pnd_running(False)
+            if self.worker.cancel_requested.is_set():
+                # Steps cut short by the cancellation fail on their own
+                status = "cancelled"
+                self.set_state_pnd_script_status("Cancelled", "Zrušeno uživatelem")
+                raise ScrapeCancelled() from e
+            if isinstance(e, PortalError):
+                status = "rejected"
+            if self.script_status[0] == "Running":
+                self.set_state_pnd_script_status(
+                    "Error", f"ERROR: Běh selhal ve fázi {self.phase}"
+                )
+            if self.debug.enabled:
+                self.debug.fail()
+                self.write_debug_zip()
+            raise
+        finally:
+            self.phase = "idle"
+            self.finish_trace(status)
+            if job == "scheduled":
+                self.schedule_next(status)
+
+    def finish_trace(self, status):
+        self.status_attributes["skipped_writes"] = self.skipped_writes
+        log(f"Unchanged entities not written: {self.skipped_writes}")
+        try:
+            self.publish_cache.save()
+        except OSError as e:
+            log(f"Failed to write the publish cache. Reason: {e}")
+        self.status_attributes["step_durations"] = self.trace.durations()
+        self.status_attributes["retries"] = self.trace.retries
+        try:
+            self.trace.write(status)
+        except OSError as e:
+            log(f"Failed to write the run trace. Reason: {e}")
+
+    def write_debug_zip(self):
+        try:
+            path = self.debug_archive.write(self.download_folder)
+            self.status_attributes["debug_archive"] = path
+            log(f"Debug Files Zipped to {path}")
+        except Exception as e:
+            log(f"Failed to zip debug files. Reason: {e}")
+
+    def run_scrape(self):
+        script_start_time = dt.now()
+        load_heavy_modules()
+        log(
+            f"{Colors.CYAN}********************* Starting {VERSION} *********************{Colors.RESET}"
+        )
+        self.set_state_pnd_running(True)
+        self.set_state_pnd_script_status("Running", "OK")
+        log("----------------------------------------------")
+        log("Hello from AppDaemon for Portal Namerenych Dat")
+        # Cleanup
+        delete_folder_contents(self.download_folder + "/")
+        os.makedirs(self.download_folder, exist_ok=True)
+        self.debug.reset()
+
+        self.set_phase("planning")
+        daily_export = not self.interval_covers_yesterday()
+        if not daily_export:
+            log("Yesterday is part of the data interval, skipping the daily exports")
+        for meter in self.meters:
+            meter.daily_export = daily_export
+            meter.ranges = self.interval_ranges(meter)
+            meter.quarter_hour_ranges = self.quarter_hour_ranges(meter)
+        self.set_phase("downloading")
+        downloaded = not any(
+            meter.daily_export or meter.ranges or meter.quarter_hour_ranges
+            for meter in self.meters
+        )
+        if downloaded:
+            log(
+                f"{Colors.GREEN}Nothing to download, processing the stored data{Colors.RESET}"
+            )
+        elif self.engine == "http":
+            try:
+                self.download_with_http()
+                downloaded = True
+            except ScrapeCancelled:
+                raise
+            except Exception as e:
+                log(
+                    f"{Colors.YELLOW}HTTP engine failed ({e}), falling back to Selenium{Colors.RESET}"
+                )
+                self.trace.retry("http_fallback")
+        if not downloaded:
+            self.download_with_selenium()
+
+        self.set_phase("processing")
+        complete = []
+        for meter in self.meters:
+            # Interval data first, the daily sensors may be read from it
+            self.process_interval_data(meter)
+            complete.append(self.process_daily_data(meter))
+            if self.quarter_hour is not None:
+                self.process_quarter_hour_data(meter)
+        self.yesterday_complete = all(complete)
+        if self.schedule is not None and self.yesterday_complete:
+            self.schedule.mark_done((dt.now() - timedelta(days=1)).date())
+
+        self.set_state_pnd_running(False)
+        log("Sensor State Set to OFF")
+        if self.debug.level == "always":
+            self.debug.write_notes()
+            self.write_debug_zip()
         script_end_time = dt.now()
         script_duration = script_end_time - script_start_time
         self.set_state(
@@ -988,6 +3895,7 @@ class pnd(hass.Hass):
                 "friendly_name": "PND Script Duration",
             },
         )
+        self.phase = "idle"
         self.set_state_pnd_script_status("Stopped", "Finished")
         log(
             f"{Colors.CYAN}********************* Duration: {script_duration} *********************{Colors.RESET}"
@@ -0,0 +1,68 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+sys.path.insert(0, ROOT)
+
+from bench_scrape import install_fake_hass  # noqa: E402
+
+install_fake_hass()
+import pnd  # noqa: E402
+
+pnd.load_heavy_modules()
+np = pnd.np
+
+
+def test_hourly_sums_keep_each_column_on_its_own_hour():
+    # Interval ends 00:15 ... 01:15, production has no data before 01:00
+    ts = np.array([900, 1800, 2700, 3600, 4500], dtype=np.int64)
+    hours, sums = pnd.hourly_sums(
+        ts,
+        {
+            "consumption": np.array([1.0, 1.0, 1.0, 1.0, 4.0]),
+            "production": np.array([np.nan] * 4 + [2.0]),
+        },
+    )
+    assert hours == ["1970-01-01T00:00", "1970-01-01T01:00"]
+    assert sums["consumption"] == [4.0, 4.0]
+    assert np.isnan(sums["production"][0])
+    assert sums["production"][1] == 2.0
+
+
+def test_hourly_sums_of_an_empty_column():
+    ts = np.array([900, 1800], dtype=np.int64)
+    hours, sums = pnd.hourly_sums(
+        ts,
+        {
+            "consumption": np.array([1.0, 2.0]),
+            "production": np.array([np.nan, np.nan]),
+        },
+    )
+    assert hours == ["1970-01-01T00:00"]
+    assert sums["consumption"] == [3.0]
+    assert np.isnan(sums["production"][0])
+
+
+def test_current_month_is_requested_from_its_second_day(tmp_path, monkeypatch):
+    class FakeDate(pnd.date):
+        @classmethod
+        def today(cls):
+            return cls(2026, 10, 2)
+
+    monkeypatch.setattr(pnd, "date", FakeDate)
+    store = pnd.QuarterHourStore(str(tmp_path))
+    missing = store.missing_months("1", FakeDate(2026, 9, 20), FakeDate(2026, 10, 1))
+    assert [month.month for month, _ in missing] == [9, 10]
+
+
+def test_month_starting_today_is_not_requested(tmp_path, monkeypatch):
+    class FakeDate(pnd.date):
+        @classmethod
+        def today(cls):
+            return cls(2026, 10, 1)
+
+    monkeypatch.setattr(pnd, "date", FakeDate)
+    store = pnd.QuarterHourStore(str(tmp_path))
+    missing = store.missing_months("1", FakeDate(2026, 9, 20), FakeDate(2026, 10, 1))
+    assert [month.month for month, _ in missing] == [9]
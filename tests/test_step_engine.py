@@ -0,0 +1,149 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "tools"))
+sys.path.insert(0, ROOT)
+
+from bench_scrape import install_fake_hass  # noqa: E402
+
+install_fake_hass()
+import pnd  # noqa: E402
+
+
+class FakeTrace:
+    def __init__(self):
+        self.retries = {}
+
+    def retry(self, name):
+        self.retries[name] = self.retries.get(name, 0) + 1
+
+
+class FakePortal:
+    # Browser state the steps act on: who is logged in, which ELM is selected
+    def __init__(self, failures, lost_on_failure=()):
+        self.lost_on_failure = lost_on_failure
+        self.account = None
+        self.elm = None
+        self.files = set()
+        self.failures = dict(failures)
+        self.calls = []
+
+    def step(self, name, effect=None):
+        def action():
+            self.calls.append(name)
+            if self.failures.get(name):
+                self.failures[name] -= 1
+                # The portal may drop part of its state together with the error
+                for attribute in self.lost_on_failure:
+                    setattr(self, attribute, None)
+                raise Exception(f"{name} failed")
+            if effect is not None:
+                effect()
+
+        return action
+
+    def login(self, account, scope):
+        return pnd.Step(
+            f"login {account}",
+            self.step(f"login {account}", lambda: setattr(self, "account", account)),
+            done=lambda: self.account == account,
+            scope=scope,
+        )
+
+    def meter(self, elm, scope):
+        return [
+            pnd.Step(
+                f"elm {elm}",
+                self.step(f"elm {elm}", lambda: setattr(self, "elm", elm)),
+                done=lambda: self.elm == elm,
+                scope=scope,
+            ),
+            pnd.Step(
+                f"export {elm}",
+                self.step(f"export {elm}", lambda: self.files.add(elm)),
+                done=lambda: elm in self.files,
+                scope=scope,
+            ),
+        ]
+
+
+def test_resume_stays_within_the_failed_account():
+    portal = FakePortal({"export 2": 1})
+    steps = (
+        [portal.login("A", (0,))]
+        + portal.meter("1", (0, "1"))
+        + [portal.login("B", (1,))]
+        + portal.meter("2", (1, "2"))
+    )
+    pnd.StepEngine(FakeTrace()).run(steps)
+    assert portal.calls == [
+        "login A",
+        "elm 1",
+        "export 1",
+        "login B",
+        "elm 2",
+        "export 2",
+        "export 2",
+    ]
+
+
+def test_resume_skips_the_other_meters_of_the_account():
+    # The failure also resets the ELM selection, only the failed meter's ELM
+    # is selected again
+    portal = FakePortal({"export 2": 1}, lost_on_failure=("elm",))
+    steps = (
+        [portal.login("A", (0,))]
+        + portal.meter("1", (0, "1"))
+        + portal.meter("2", (0, "2"))
+        + portal.meter("3", (0, "3"))
+    )
+    pnd.StepEngine(FakeTrace()).run(steps)
+    assert portal.calls == [
+        "login A",
+        "elm 1",
+        "export 1",
+        "elm 2",
+        "export 2",
+        "elm 2",
+        "export 2",
+        "elm 3",
+        "export 3",
+    ]
+
+
+def test_lost_session_is_restored_for_the_failed_account_only():
+    portal = FakePortal({"export 2": 1}, lost_on_failure=("account", "elm"))
+    steps = (
+        [portal.login("A", (0,))]
+        + portal.meter("1", (0, "1"))
+        + [portal.login("B", (1,))]
+        + portal.meter("2", (1, "2"))
+    )
+    trace = FakeTrace()
+    pnd.StepEngine(trace).run(steps)
+    assert portal.calls[6:] == ["login B", "elm 2", "export 2"]
+    assert trace.retries == {"export 2": 1}
+
+
+def test_step_over_its_timeout_fails_the_attempt():
+    worker = pnd.ScrapeWorker(lambda job: None)
+    calls = []
+
+    def slow_then_fast():
+        calls.append(len(calls))
+        worker.sleep(5 if len(calls) == 1 else 0)
+
+    trace = FakeTrace()
+    try:
+        started = pnd.time.monotonic()
+        pnd.StepEngine(
+            trace,
+            set_deadline=lambda deadline: setattr(worker, "deadline", deadline),
+        ).run([pnd.Step("slow", slow_then_fast, timeout=0.2)])
+        assert pnd.time.monotonic() - started < 2
+    finally:
+        worker.stop()
+    assert calls == [0, 1]
+    assert trace.retries == {"slow": 1}
+    assert worker.deadline is None
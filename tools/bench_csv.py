@@ -0,0 +1,105 @@
+"""Compare the per-row converter with the vectorized CSV parser of pnd.py.
+
+Generates synthetic PND exports (daily and quarter-hour profiles, with the
+portal's 24:00:00 end-of-day stamps) and times both parse paths:
+
+    python tools/bench_csv.py --years 3 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime as dt, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from pnd import load_heavy_modules, period_days, read_pnd_csv  # noqa: E402
+
+
+def legacy_read(path):
+    # Parser used up to 0.9.9.7
+    return pd.read_csv(
+        path,
+        delimiter=";",
+        encoding="latin1",
+        converters={
+            0: lambda s: dt.strptime(
+                s.replace("24:00:00", "23:59:00"), "%d.%m.%Y %H:%M:%S"
+            )
+        },
+    )
+
+
+def format_stamp(stamp):
+    if stamp.hour == 0 and stamp.minute == 0:
+        previous = stamp - timedelta(days=1)
+        return previous.strftime("%d.%m.%Y") + " 24:00:00"
+    return stamp.strftime("%d.%m.%Y %H:%M:%S")
+
+
+def write_export(path, start, step, rows):
+    random.seed(rows)
+    with open(path, "w", encoding="latin1") as file:
+        file.write("Datum;Hodnota [kWh];Status\n")
+        stamp = start
+        for _ in range(rows):
+            stamp += step
+            file.write(f"{format_stamp(stamp)};{random.random() * 3:.3f};namerena\n")
+
+
+def best_of(func, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(path)
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    load_heavy_modules()
+
+    engines = ["c"]
+    try:
+        import pyarrow  # noqa: F401
+
+        engines.append("pyarrow")
+    except ImportError:
+        print("pyarrow not installed, skipping the pyarrow engine")
+
+    start = dt(2020, 1, 1)
+    profiles = [
+        ("daily", timedelta(days=1), 365 * args.years),
+        ("quarter-hour", timedelta(minutes=15), 96 * 365 * args.years),
+    ]
+    with tempfile.TemporaryDirectory() as folder:
+        for name, step, rows in profiles:
+            path = os.path.join(folder, f"{name}.csv")
+            write_export(path, start, step, rows)
+            legacy_time, legacy = best_of(legacy_read, path, args.repeat)
+            print(f"{name}: {rows} rows, {os.path.getsize(path) / 1e6:.1f} MB")
+            print(f"  legacy converter    {legacy_time * 1000:9.1f} ms")
+            for engine in engines:
+                elapsed, data = best_of(
+                    lambda p: read_pnd_csv(p, engine), path, args.repeat
+                )
+                # Every row must land on the day that starts the measured period
+                first_day = period_days(data["timestamp"]).iloc[0]
+                assert first_day == pd.Timestamp(start), first_day
+                assert len(data) == len(legacy)
+                print(
+                    f"  vectorized ({engine:7}) {elapsed * 1000:9.1f} ms"
+                    f"  x{legacy_time / elapsed:.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
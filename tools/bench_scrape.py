@@ -0,0 +1,202 @@
+"""Benchmark a full pnd run against the local stub portal.
+
+Starts tools/pnd_stub_portal.py on a free port, runs the real pnd app with a
+minimal stand-in for AppDaemon's hass.Hass and reports the step timings
+recorded by the run trace, the end-to-end time, the number of WebDriver
+commands and portal requests, and the peak memory:
+
+    python tools/bench_scrape.py --engine http --runs 3 --latency 0.1
+    python tools/bench_scrape.py --engine selenium --days 30
+
+The selenium engine needs Chrome and /usr/bin/chromedriver, like the app.
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime as dt, timedelta
+
+TOOLS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, TOOLS_FOLDER)
+sys.path.insert(0, os.path.dirname(TOOLS_FOLDER))
+
+
+class FakeHass:
+    # The parts of appdaemon.plugins.hass.hassapi.Hass used by pnd.py
+    def __init__(self, args):
+        self.args = args
+        self.states = {}
+        self.state_writes = 0
+
+    def set_state(self, entity_id, state=None, attributes=None, **kwargs):
+        self.state_writes += 1
+        self.states[entity_id] = {"state": state, "attributes": attributes or {}}
+        return self.states[entity_id]
+
+    def get_state(self, entity_id=None, attribute=None, **kwargs):
+        entry = self.states.get(entity_id)
+        if entry is None or attribute == "all":
+            return entry
+        if attribute is None:
+            return entry["state"]
+        return entry["attributes"].get(attribute)
+
+    def listen_event(self, callback, event=None, **kwargs):
+        return event
+
+    def run_in(self, callback, delay, **kwargs):
+        # Timers never fire during a benchmark run
+        return object()
+
+    def run_daily(self, callback, start, **kwargs):
+        return object()
+
+    def cancel_timer(self, handle):
+        pass
+
+
+def install_fake_hass():
+    modules = {}
+    for name in (
+        "appdaemon",
+        "appdaemon.plugins",
+        "appdaemon.plugins.hass",
+        "appdaemon.plugins.hass.hassapi",
+    ):
+        modules[name] = sys.modules[name] = types.ModuleType(name)
+    modules["appdaemon.plugins.hass.hassapi"].Hass = FakeHass
+    modules["appdaemon.plugins.hass"].hassapi = modules[
+        "appdaemon.plugins.hass.hassapi"
+    ]
+
+
+def count_webdriver_commands(counts):
+    from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+    execute = RemoteConnection.execute
+
+    def counted(self, command, params):
+        counts[command] = counts.get(command, 0) + 1
+        return execute(self, command, params)
+
+    RemoteConnection.execute = counted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=("http", "selenium"), default="http")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--days", type=int, default=365, help="length of DataInterval")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="added delay per portal request"
+    )
+    parser.add_argument("--elm", action="append", help="ELM, may be repeated")
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="extra apps.yaml parameter (JSON value), may be repeated",
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    install_fake_hass()
+    tracemalloc.start()
+    import pnd
+    from pnd_stub_portal import StubPortalHandler, start_stub_portal
+
+    pnd.load_heavy_modules()
+    webdriver_commands = {}
+    count_webdriver_commands(webdriver_commands)
+    elms = args.elm or ["3000012345"]
+    server, base_url = start_stub_portal(latency=args.latency, elms=elms)
+    today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    data_from = today - timedelta(days=args.days)
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        config = {
+            "PNDUserName": "bench@example.com",
+            "PNDUserPassword": "bench",
+            "ELM": elms if len(elms) > 1 else elms[0],
+            "DownloadFolder": os.path.join(folder, "pnd"),
+            "StateFolder": os.path.join(folder, "state"),
+            "DataInterval": f"{data_from:%d.%m.%Y %H:%M} - {today:%d.%m.%Y %H:%M}",
+            "Engine": args.engine,
+            "PNDBaseURL": base_url,
+        }
+        for option in args.option:
+            name, _, value = option.partition("=")
+            try:
+                config[name] = json.loads(value)
+            except ValueError:
+                config[name] = value
+        os.makedirs(config["DownloadFolder"], exist_ok=True)
+        app = pnd.pnd(config)
+        app.initialize()
+        try:
+            for run in range(args.runs):
+                webdriver_commands.clear()
+                StubPortalHandler.requests.clear()
+                tracemalloc.reset_peak()
+                state_writes = app.state_writes
+                started = time.perf_counter()
+                app.run_job("bench")
+                elapsed = time.perf_counter() - started
+                results.append(
+                    {
+                        "run": run + 1,
+                        "duration": round(elapsed, 3),
+                        "steps": app.trace.durations(),
+                        "retries": dict(app.trace.retries),
+                        "webdriver_commands": sum(webdriver_commands.values()),
+                        "portal_requests": sum(StubPortalHandler.requests.values()),
+                        "state_writes": app.state_writes - state_writes,
+                        "python_peak_mb": round(
+                            tracemalloc.get_traced_memory()[1] / 1e6, 1
+                        ),
+                    }
+                )
+        finally:
+            app.terminate()
+            server.shutdown()
+
+    # ru_maxrss is in kB on Linux; children include chromedriver and Chrome
+    peak_rss = {
+        "process_peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "children_peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1
+        ),
+    }
+    for result in results:
+        print(
+            f"run {result['run']}: {result['duration']:.2f} s, "
+            f"{result['webdriver_commands']} WebDriver commands, "
+            f"{result['portal_requests']} portal requests, "
+            f"{result['state_writes']} state writes, "
+            f"Python peak {result['python_peak_mb']} MB"
+        )
+        for name, seconds in sorted(result["steps"].items()):
+            print(f"  {name:55} {seconds:8.3f} s")
+        if result["retries"]:
+            print(f"  retries: {result['retries']}")
+    print(
+        f"peak RSS: process {peak_rss['process_peak_rss_mb']} MB, "
+        f"children {peak_rss['children_peak_rss_mb']} MB"
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"runs": results, **peak_rss}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
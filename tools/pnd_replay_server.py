@@ -0,0 +1,136 @@
+"""Local stand-in for the PND portal that replays recorded HTTP responses.
+
+Record a session in the browser developer tools (Network > Save all as HAR)
+while logging in to the portal and exporting the CSV files, then run:
+
+    python tools/pnd_replay_server.py recording.har --port 8080
+
+and point the app at it in apps.yaml:
+
+    Engine: "http"
+    PNDBaseURL: "http://127.0.0.1:8080/cezpnd2"
+
+Responses are matched by method, path and query string (falling back to
+method and path).  Repeated requests to the same URL are answered with the
+recorded responses in order, the last one is repeated afterwards.  Absolute
+redirects are rewritten to the local server, so the login hop to the
+authentication server is replayed from the same recording.
+"""
+
+import argparse
+import base64
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+SKIPPED_HEADERS = {
+    "content-encoding",
+    "content-length",
+    "transfer-encoding",
+    "connection",
+    "strict-transport-security",
+}
+
+
+def load_har(path):
+    with open(path, encoding="utf-8") as file:
+        har = json.load(file)
+    responses = {}
+    for entry in har["log"]["entries"]:
+        request, response = entry["request"], entry["response"]
+        url = urlsplit(request["url"])
+        content = response.get("content", {})
+        body = content.get("text", "") or ""
+        if content.get("encoding") == "base64":
+            body = base64.b64decode(body)
+        else:
+            body = body.encode("utf-8")
+        recorded = {
+            "status": response["status"],
+            "headers": [(h["name"], h["value"]) for h in response["headers"]],
+            "body": body,
+        }
+        for key in (
+            (request["method"], url.path, url.query),
+            (request["method"], url.path, None),
+        ):
+            responses.setdefault(key, []).append(recorded)
+    return responses
+
+
+def localize_header(name, value, local_origin):
+    lowered = name.lower()
+    if lowered == "location":
+        url = urlsplit(value)
+        if url.scheme and url.netloc:
+            value = local_origin + url.path + (f"?{url.query}" if url.query else "")
+    elif lowered == "set-cookie":
+        # Recorded cookies are bound to the portal domain and https
+        parts = [
+            p
+            for p in value.split(";")
+            if p.strip().lower().split("=")[0] not in ("domain", "secure", "samesite")
+        ]
+        value = ";".join(parts)
+    return name, value
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    responses = {}
+    served = {}
+    latency = 0.0
+
+    def _replay(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        recorded = None
+        for key in (
+            (self.command, url.path, url.query),
+            (self.command, url.path, None),
+        ):
+            if key in self.responses:
+                index = self.served.get(key, 0)
+                candidates = self.responses[key]
+                recorded = candidates[min(index, len(candidates) - 1)]
+                self.served[key] = index + 1
+                break
+        if self.latency:
+            time.sleep(self.latency)
+        if recorded is None:
+            self.send_error(404, f"No recorded response for {self.command} {self.path}")
+            return
+        local_origin = f"http://{self.headers.get('Host')}"
+        self.send_response(recorded["status"])
+        for name, value in recorded["headers"]:
+            if name.lower() in SKIPPED_HEADERS or name.startswith(":"):
+                continue
+            self.send_header(*localize_header(name, value, local_origin))
+        self.send_header("Content-Length", str(len(recorded["body"])))
+        self.end_headers()
+        self.wfile.write(recorded["body"])
+
+    do_GET = _replay
+    do_POST = _replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("har", help="HAR file recorded from the PND portal")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="added delay per request in seconds"
+    )
+    args = parser.parse_args()
+    ReplayHandler.responses = load_har(args.har)
+    ReplayHandler.latency = args.latency
+    server = ThreadingHTTPServer((args.host, args.port), ReplayHandler)
+    print(f"Replaying {args.har} on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
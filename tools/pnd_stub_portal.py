@@ -0,0 +1,333 @@
+"""Local stand-in for the PND portal built from static pages.
+
+Unlike pnd_replay_server.py it needs no recording: it serves a login form, a
+dashboard with the .pnd-window, the multiselects and the export dropdown used
+by the Selenium steps of pnd.py, and the JSON export endpoint used by the
+http engine.  CSV exports of the daily and quarter-hour profiles are generated for any
+requested period with deterministic values.
+
+    python tools/pnd_stub_portal.py --port 8080 --latency 0.2
+
+and point the app at it in apps.yaml:
+
+    PNDBaseURL: "http://127.0.0.1:8080/cezpnd2"
+"""
+
+import argparse
+import json
+import random
+import secrets
+import threading
+import time
+from datetime import datetime as dt, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BASE_PATH = "/cezpnd2"
+DASHBOARD_PATH = BASE_PATH + "/external/dashboard/view"
+LOGIN_PATH = BASE_PATH + "/login"
+EXPORT_PATH = BASE_PATH + "/external/data/export"
+DOWNLOAD_PATH = BASE_PATH + "/external/data/download"
+SESSION_COOKIE = "PNDSESSION"
+PROFILES = {"-1027": "07", "-1028": "08", "-1021": "01", "-1022": "02"}
+# 01/02 are the quarter-hour profiles, 07/08 the daily ones
+QUARTER_HOUR_PROFILES = ("01", "02")
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Přihlášení</title></head>
+<body>
+<form method="post" action="{login_path}">
+  <input type="email" name="username" placeholder="Zadejte svůj e-mail">
+  <input type="password" name="password" placeholder="Zadejte své heslo">
+  <button type="submit" class="mui-btn mui-btn--primary">Přihlásit</button>
+</form>
+</body></html>
+"""
+
+DASHBOARD_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>PND</title>
+<style>
+  body {{ margin: 0; min-height: 100vh; }}
+  #app {{ width: 560px; padding: 8px; }}
+  .multiselect__content-wrapper, .hidden {{ display: none; }}
+  .open > .multiselect__content-wrapper, .shown {{ display: block; }}
+  .multiselect__option {{ display: block; padding: 2px; cursor: pointer; }}
+</style></head>
+<body>
+<div id="app">
+  <h1>Naměřená data</h1>
+  <div>Verze aplikace: {version}</div>
+  <div class="pnd-window">
+    <button title="Export" onclick="showForm()">Export</button>
+    <button title="Tabulka dat" onclick="state.table = true">Tabulka dat</button>
+    <div id="profiles" class="hidden">
+      <a href="#" onclick="return selectProfile('07')">07 Profil spotřeby za den (+A)</a>
+      <a href="#" onclick="return selectProfile('08')">08 Profil výroby za den (-A)</a>
+      <a href="#" onclick="return selectProfile('01')">01 Profil spotřeby (+A)</a>
+      <a href="#" onclick="return selectProfile('02')">02 Profil výroby (-A)</a>
+    </div>
+  </div>
+  <div id="form" class="hidden">
+    <div class="form-group">
+      <label>Sestava</label>
+      <div class="multiselect" data-field="report">
+        <div class="multiselect__select"></div>
+        <div class="multiselect__tags"><span class="multiselect__single"></span></div>
+        <div class="multiselect__content-wrapper">
+          <span class="multiselect__option">Rychlá sestava</span>
+        </div>
+      </div>
+    </div>
+    <div class="form-group">
+      <label>Množina zařízení</label>
+      <div class="multiselect" data-field="elm">
+        <div class="multiselect__select"></div>
+        <div class="multiselect__tags"><span class="multiselect__single"></span></div>
+        <div class="multiselect__content-wrapper">{elm_options}</div>
+      </div>
+    </div>
+    <div class="form-group">
+      <label>Období</label>
+      <div class="multiselect" data-field="period">
+        <div class="multiselect__select"></div>
+        <div class="multiselect__tags"><span class="multiselect__single"></span></div>
+        <div class="multiselect__content-wrapper">
+          <span class="multiselect__option">Včera</span>
+          <span class="multiselect__option">Vlastní</span>
+        </div>
+      </div>
+    </div>
+    <div id="custom" class="form-group hidden">
+      <label>Vlastní období</label>
+      <input type="text" id="custom-period">
+    </div>
+    <button class="btn disabled" id="search" onclick="state.searched = true">Vyhledat data</button>
+    <button onclick="toggleExport()">Exportovat data</button>
+    <div id="export-menu" class="hidden"><a href="#" onclick="return download()">CSV</a></div>
+  </div>
+</div>
+<script>
+var state = {{}};
+function showForm() {{
+  document.getElementById('form').className = 'shown';
+  document.getElementById('profiles').className = 'shown';
+}}
+function selectProfile(profile) {{ state.profile = profile; return false; }}
+function toggleExport() {{
+  var menu = document.getElementById('export-menu');
+  menu.className = menu.className == 'shown' ? 'hidden' : 'shown';
+}}
+function download() {{
+  var period = document.getElementById('custom-period').value;
+  var query = 'profile=' + state.profile + '&elm=' + encodeURIComponent(state.elm || '');
+  if (state.period == 'Vlastní') {{
+    query += '&period=' + encodeURIComponent(period);
+  }} else {{
+    query += '&period=yesterday';
+  }}
+  document.getElementById('export-menu').className = 'hidden';
+  window.location.href = '{download_path}?' + query;
+  return false;
+}}
+document.addEventListener('click', function (event) {{
+  var option = event.target.closest('.multiselect__option');
+  var select = event.target.closest('.multiselect');
+  document.querySelectorAll('.multiselect.open').forEach(function (open) {{
+    if (open !== select) open.classList.remove('open');
+  }});
+  if (option) {{
+    var text = option.textContent.trim();
+    select.querySelector('.multiselect__single').textContent = text;
+    select.classList.remove('open');
+    state[select.dataset.field] = text;
+    if (select.dataset.field == 'elm') {{
+      document.getElementById('search').className = 'btn';
+    }}
+    if (select.dataset.field == 'period') {{
+      document.getElementById('custom').className =
+        text == 'Vlastní' ? 'form-group shown' : 'form-group hidden';
+    }}
+  }} else if (select) {{
+    select.classList.add('open');
+  }}
+}});
+</script>
+</body></html>
+"""
+
+
+def profile_csv(profile, elm, period_from, period_to):
+    # Rows are stamped with the end of their period, midnight as 24:00:00
+    # of the previous day, like the portal does
+    step = timedelta(minutes=15) if profile in QUARTER_HOUR_PROFILES else timedelta(1)
+    high = 20 if profile in ("01", "07") else 30
+    if step < timedelta(1):
+        high /= 96
+    lines = ["Datum;Hodnota [kWh];Status"]
+    start = period_from
+    while start < period_to:
+        end = start + step
+        value = random.Random(f"{profile}|{elm}|{start:%Y-%m-%d %H:%M}").uniform(
+            0, high
+        )
+        if end.hour == 0 and end.minute == 0:
+            stamp = f"{end - timedelta(1):%d.%m.%Y} 24:00:00"
+        else:
+            stamp = f"{end:%d.%m.%Y %H:%M:%S}"
+        lines.append(f"{stamp};{value:.3f};namerena")
+        start = end
+    return ("\n".join(lines) + "\n").encode("latin1")
+
+
+def parse_period(value):
+    # "dd.mm.yyyy HH:MM - dd.mm.yyyy HH:MM" or "yesterday"
+    if value == "yesterday":
+        today = dt.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=1), today
+    start, end = [part.strip() for part in value.split(" - ", 1)]
+    return dt.strptime(start, "%d.%m.%Y %H:%M"), dt.strptime(end, "%d.%m.%Y %H:%M")
+
+
+class StubPortalHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    version = "stub"
+    elms = ["3000012345"]
+    sessions = set()
+    requests = {}
+    downloads = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def logged_in(self):
+        for part in (self.headers.get("Cookie") or "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == SESSION_COOKIE and value in self.sessions:
+                return True
+        return False
+
+    def reply(self, status, body, content_type, headers=()):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def reply_html(self, html, status=200):
+        self.reply(status, html.encode("utf-8"), "text/html; charset=utf-8")
+
+    def reply_csv(self, body):
+        with self.lock:
+            StubPortalHandler.downloads += 1
+            name = f"pnd-export-{StubPortalHandler.downloads}.csv"
+        self.reply(
+            200,
+            body,
+            "text/csv",
+            [("Content-Disposition", f'attachment; filename="{name}"')],
+        )
+
+    def login_page(self):
+        return LOGIN_PAGE.format(login_path=LOGIN_PATH)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.count(url.path)
+        time.sleep(self.latency)
+        if url.path == DASHBOARD_PATH:
+            if not self.logged_in():
+                self.reply_html(self.login_page())
+                return
+            options = "".join(
+                f'<span class="multiselect__option">ELM {elm}</span>'
+                for elm in self.elms
+            )
+            self.reply_html(
+                DASHBOARD_PAGE.format(
+                    version=self.version,
+                    elm_options=options,
+                    download_path=DOWNLOAD_PATH,
+                )
+            )
+        elif url.path == DOWNLOAD_PATH:
+            if not self.logged_in():
+                self.reply_html(self.login_page())
+                return
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            day_from, day_to = parse_period(query.get("period", "yesterday"))
+            elm = query.get("elm", "").replace("ELM", "").strip()
+            self.reply_csv(profile_csv(query.get("profile"), elm, day_from, day_to))
+        else:
+            self.reply_html("Not found", 404)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        self.count(url.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        time.sleep(self.latency)
+        if url.path == LOGIN_PATH:
+            form = {k: v[0] for k, v in parse_qs(body.decode("utf-8")).items()}
+            if not form.get("username") or not form.get("password"):
+                self.reply_html(self.login_page(), 401)
+                return
+            token = secrets.token_hex(16)
+            self.sessions.add(token)
+            self.send_response(302)
+            self.send_header("Location", DASHBOARD_PATH)
+            self.send_header("Set-Cookie", f"{SESSION_COOKIE}={token}; Path=/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif url.path == EXPORT_PATH:
+            if not self.logged_in():
+                self.reply_html(self.login_page())
+                return
+            payload = json.loads(body or b"{}")
+            day_from = dt.strptime(payload["intervalFrom"], "%d.%m.%Y %H:%M")
+            day_to = dt.strptime(payload["intervalTo"], "%d.%m.%Y %H:%M")
+            profile = PROFILES[str(payload["idAssembly"])]
+            self.reply_csv(
+                profile_csv(profile, str(payload["electrometerId"]), day_from, day_to)
+            )
+        else:
+            self.reply_html("Not found", 404)
+
+
+def start_stub_portal(host="127.0.0.1", port=0, latency=0.0, elms=None):
+    # Starts the portal on a background thread, returns (server, base_url)
+    StubPortalHandler.latency = latency
+    StubPortalHandler.elms = [str(elm) for elm in elms or StubPortalHandler.elms]
+    StubPortalHandler.sessions = set()
+    StubPortalHandler.requests = {}
+    server = ThreadingHTTPServer((host, port), StubPortalHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}{BASE_PATH}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="added delay per request in seconds"
+    )
+    parser.add_argument("--elm", action="append", help="ELM offered by the portal")
+    args = parser.parse_args()
+    server, base_url = start_stub_portal(args.host, args.port, args.latency, args.elm)
+    print(f"Stub PND portal on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()